@@ -6,32 +6,68 @@ Layout:
  - Middle: LEFT = current readings; RIGHT = terminal/log (short)
  - Bottom: two side-by-side graphs (left: Temp + Humidity, right: Gas)
 Includes: MQTT subscribe, keyboard command publishes, SQLite persistence.
+
+    python IOTfrontend.py [--db sensor_data.db] [--read-only] [--profile-startup] [--perf-dump perf.json|perf.prom]
+    python IOTfrontend.py --headless [daemon.py options]   (recorder only, no GUI)
+    python IOTfrontend.py --replay sensor_data.db [--speed 60]   (stored data, nothing recorded)
 """
 
+import time
+_T_START = time.perf_counter()
+
+import sys
+if __name__ == "__main__" and "--headless" in sys.argv[1:]:
+    # before tkinter/matplotlib are touched: the recorder must run without a display
+    from daemon import main
+    sys.exit(main())
+
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import time, json, queue, csv, re, math
-from collections import deque
+import re, math, os, json, threading, argparse, datetime
 import socket, subprocess, struct, fcntl
-import sqlite3
 
-import paho.mqtt.client as mqtt
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from storage import DB_PATH, open_db, ensure_schema, SQLiteWriter
+from ingest import IngestPipeline, DbTail, DEFAULT_TOPIC
+from connection import MqttConnection, default_client_id
+from series import DeviceSeries
+from logpanel import LogPanel
+from frames import FrameScheduler, TextCache
+from perf import perf
+from history import HistoryLoader, CHANNELS as HISTORY_CHANNELS
+from retention import RetentionWorker, RAW_DAYS
+from api import ApiServer, parse_addr
+from replay import Replay, open_source
+from alerts import AlertEngine, load_rules, alert_payload, describe as describe_alert, ALERT_TOPIC_FMT
+from export import (ExportJob, parse_time, COLUMNS as EXPORT_COLUMNS,
+                    DEFAULT_COLUMNS as DEFAULT_EXPORT_COLUMNS, FORMATS as EXPORT_FORMATS)
+
+# paho and matplotlib are imported where first used (connection thread, _build_plot):
+# matplotlib alone costs more than the rest of startup combined
 
 # ---------------- CONFIG ----------------
 DEFAULT_BROKER = "172.16.18.157"
 DEFAULT_PORT = 1883
-DEFAULT_TOPIC = "home/air/esp01/data"
-DEFAULT_CMD_TOPIC = "home/air/esp01/cmd"
+CMD_TOPIC_FMT = "home/air/{device}/cmd"
 DEFAULT_USER = "esp01"
 DEFAULT_PASS = "pass"
 
-MAX_POINTS = 600
-POLL_MS = 200
+PLOT_WINDOW_S = 6 * 3600  # seconds of history on the live x axis; older data is in History mode
+PLOT_RATE_HZ = 0.2        # per-device rate the live buffers are sized for (firmware: one per 10 s)
+# samples kept per channel and device: 4320, about 0.4 MB per device once full (40 MB for 100);
+# a device publishing faster than PLOT_RATE_HZ shows proportionally less than PLOT_WINDOW_S
+MAX_POINTS = int(PLOT_WINDOW_S * PLOT_RATE_HZ)
+DEVICE_REFRESH_S = 1.0   # how often the device list is refreshed
+PLOT_BLIT = True    # update lines in place and blit them over a cached background
+DB_STATS_S = 60     # how often the writer's throughput is printed to the log
 
 TEMP_STEP = 0.5
 HUM_STEP = 1.0
+
+STARTUP_BUDGET_MS = 500   # window should be on screen within this (see --profile-startup)
+NET_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".net_cache.json")
+PERF_PANEL_MS = 1000      # refresh interval of the performance panel (F9)
+HISTORY_SPAN_S = 24 * 3600   # range shown when History mode is switched on
+HISTORY_ZOOM = 1.25          # per mouse wheel step
 # --------------------------------------
 
 
@@ -64,11 +100,12 @@ def get_all_ipv4_addresses():
         return []
 
 
-def detect_local_ip_dynamic(preferred='wlan0'):
+def detect_local_ip_dynamic(preferred='wlan0', entries=None):
     ip = _get_ip_ioctl(preferred)
     if ip:
         return ip
-    entries = get_all_ipv4_addresses()
+    if entries is None:
+        entries = get_all_ipv4_addresses()
     if entries:
         # return preferred if present
         for iface, addr in entries:
@@ -84,57 +121,198 @@ def detect_local_ip_dynamic(preferred='wlan0'):
         return ip
     except Exception:
         return DEFAULT_BROKER
+
+
+def load_net_cache():
+    # last discovery result, so the host box is filled before discovery finishes
+    try:
+        with open(NET_CACHE) as f:
+            d = json.load(f)
+        return list(d.get("ips", [])), d.get("host") or DEFAULT_BROKER
+    except Exception:
+        return [], DEFAULT_BROKER
+
+
+def save_net_cache(ips, host):
+    try:
+        with open(NET_CACHE, "w") as f:
+            json.dump({"ips": ips, "host": host}, f)
+    except Exception:
+        pass
 # --------------------------------------
 
-def sanitize_table_name(name):
-    # allow only letters, numbers, underscore
-    return re.sub(r'\W+', '_', name)
 
+class StartupTimer:
+    """Per-phase wall time from process start until the dashboard is usable."""
+
+    def __init__(self, t0=_T_START):
+        self.t0 = self.last = t0
+        self.phases = []
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, (now - self.last) * 1000.0))
+        self.last = now
+
+    def total_ms(self):
+        return (self.last - self.t0) * 1000.0
+
+    def report(self):
+        lines = [f"  {name:<24}{ms:8.1f} ms" for name, ms in self.phases]
+        total = self.total_ms()
+        flag = "" if total <= STARTUP_BUDGET_MS else f"  (over {STARTUP_BUDGET_MS} ms budget)"
+        lines.append(f"  {'total':<24}{total:8.1f} ms{flag}")
+        return "startup:\n" + "\n".join(lines)
 
 class IoTFrontend:
-    def __init__(self, root):
+    def __init__(self, root, startup=None, profile_startup=False, read_only=False, perf_dump=None,
+                 alert_rules=None, api_addr=None, replay=None, db_path=DB_PATH):
         self.root = root
-        root.title("Air Sensor Dashboard")
-
-        # app state
-        self.msg_q = queue.Queue()
-        self.mqtt_client = None
-        self.connected = False
-
-        self.temp_buf = deque(maxlen=MAX_POINTS)
-        self.hum_buf = deque(maxlen=MAX_POINTS)
-        self.gas_buf = deque(maxlen=MAX_POINTS)
-        self.raw_log = []
-
-        # DB (SQLite)
-        self.db = sqlite3.connect("sensor_data.db", check_same_thread=False)
-        self.db_cursor = self.db.cursor()
-
-        raw_user = DEFAULT_USER
-        self.table_name = sanitize_table_name(raw_user)
-
-        self.db_cursor.execute(f"""
-        CREATE TABLE IF NOT EXISTS {self.table_name} (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
-            topic TEXT NOT NULL,
-            temperature REAL,
-            humidity REAL,
-            gas REAL,
-            payload TEXT
-        )
-        """)
-        self.db.commit()
-
-
-        # build UI and plots
+        self.db_path = db_path
+        # replay: (source, speed, devices) fed through the ingest path; runs read-only, so nothing
+        # is recorded and no local database has to exist
+        read_only = read_only or replay is not None
+        root.title("Air Sensor Dashboard" + (" (replay)" if replay else " (read-only)" if read_only else ""))
+        # read-only: another process (daemon.py) records; we only follow the database
+        self.read_only = read_only
+        self.startup = startup or StartupTimer()
+        self.profile_startup = profile_startup
+        self.startup.mark("imports + Tk")
+
+        # app state; MqttConnection owns the paho client and its reconnect loop
+        self.mqtt = None
+        self._mqtt_state = None
+
+        # one DeviceSeries per device id seen on the wildcard topic
+        self.devices = {}
+        self.selected = DEFAULT_USER
+        self._devices_dirty = set()
+        self._devices_refresh_at = 0.0
+
+        # DB (SQLite); old per-device tables are migrated to the v2 schema here.
+        # Read-only mode never opens it here: the tail, history and export have their own connections
+        self.db = None if read_only else open_db(db_path)
+        migrated = [] if read_only else ensure_schema(self.db)
+        self.startup.mark("database")
+
+        # inserts are batched on a separate thread (see storage.SQLiteWriter)
+        self.writer = None if read_only else SQLiteWriter(db_path)
+        if self.writer:
+            self.writer.start()
+        # pruning/archiving/vacuum in small steps, first pass a while after startup
+        self.raw_days = RAW_DAYS   # raw rows older than this are only in the rollups
+        self.retention = None if read_only else RetentionWorker(db_path, raw_days=self.raw_days)
+        if self.retention:
+            self.retention.start()
+        self._db_stats_at = time.monotonic() + DB_STATS_S
+        self._db_rows_seen = (time.monotonic(), 0)   # for the rows/s in the DB log line
+
+        # alert rules run in the ingest thread; the recorder evaluates them in read-only mode
+        self.alerts = None if read_only and not replay else AlertEngine(alert_rules)
+        self.active_alerts = {}   # device -> names of raised rules
+
+        # decode/parse/persist runs off the Tk thread; _poll_queue only renders
+        self.ingest = IngestPipeline(self.writer, alerts=self.alerts, on_alert=self._publish_alert)
+        self.ingest.start()
+        self.db_tail = None
+        self.replay = None
+        if replay:
+            source, speed, devices = replay
+            self.replay = Replay(open_source(source, devices), self.ingest, speed)
+        elif read_only:
+            self.db_tail = DbTail(self.ingest, db_path)
+            self.db_tail.start()
+
+        # optional local HTTP/WebSocket API, fed from the batches drained in _poll_queue
+        self.api = None
+        if api_addr:
+            self.api = ApiServer(*api_addr, db_path=db_path, raw_days=self.raw_days)
+            self.api.start()
+
+        # hot-path timings (perf.py): off unless dumped to a file or the F9 panel is open
+        self.perf_dump = perf_dump
+        self.perf_win = None
+        perf.add_source("ingest", self.ingest.stats)
+        if self.writer:
+            perf.add_source("db", self.writer.stats)
+        perf.add_source("mqtt", lambda: self.mqtt.stats() if self.mqtt else {})
+        if self.alerts:
+            perf.add_source("alerts", self.alerts.stats)
+        if self.api:
+            perf.add_source("api", self.api.stats)
+        if perf_dump:
+            perf.enabled = True
+            perf.start_dump(perf_dump)
+
+        # History mode: (t0, t1) shown from the database instead of the live buffers
+        self.history = None
+        self.hist_range = None
+        self._hist_drag = None
+
+        # render step: runs on an adaptive timer (frames.py), redraws only when asked to
+        self.frames = None
+        self.labels = TextCache()
+        self._plot_dirty = False
+
+        # build UI now; plots (matplotlib) once the window is on screen
+        self.canvas = None
         self._build_ui()
-        self._build_plot()
+        self.startup.mark("widgets")
+        if migrated:
+            self._log("DB", f"Migrated {', '.join(migrated)} to the indexed readings table")
 
         # bindings, loop
         self.root.bind("<Key>", self._on_keypress)
-        self.root.after(POLL_MS, self._poll_queue)
+        self.root.bind("<F9>", lambda e: self.toggle_perf_panel())
         self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+        self.root.after(1, self._finish_startup)
+        self._start_net_discovery()
+
+    def _finish_startup(self):
+        # first timer callback: the window has been mapped; flush pending redraws
+        self.root.update_idletasks()
+        self.startup.mark("window shown")
+        self._build_plot()
+        self._update_plot()
+        self.startup.mark("plots")
+        self._log("SYS", f"Started in {self.startup.total_ms():.0f} ms")
+        if self.profile_startup:
+            print(self.startup.report(), flush=True)
+        self.frames = FrameScheduler(self.root, self._poll_queue)
+        perf.add_source("frames", self.frames.stats)
+        self.frames.start()
+        if self.replay is not None:
+            self._log("SYS", f"Replaying at {self.replay.speed or 'max'} x")
+            perf.add_source("replay", self.replay.stats)
+            self.replay.start()
+
+    # ---------------- NETWORK DISCOVERY ----------------
+    def _start_net_discovery(self):
+        # `ip` subprocesses + UDP probe run on a thread; result is picked up by polling
+        self._net_result = None
+        self._net_t0 = time.perf_counter()
+
+        def work():
+            entries = get_all_ipv4_addresses()
+            host = detect_local_ip_dynamic(entries=entries)
+            self._net_result = ([ip for _, ip in entries], host)
+
+        threading.Thread(target=work, name="net-discovery", daemon=True).start()
+        self.root.after(50, self._poll_net_discovery)
+
+    def _poll_net_discovery(self):
+        if self._net_result is None:
+            self.root.after(50, self._poll_net_discovery)
+            return
+        ips, host = self._net_result
+        self.host_e.config(values=ips)
+        # don't clobber a host the user already typed
+        if self.host_e.get().strip() == self._cached_host:
+            self.host_e.set(host)
+        save_net_cache(ips, host)
+        if self.profile_startup:
+            ms = (time.perf_counter() - self._net_t0) * 1000.0
+            print(f"  net discovery (background) {ms:.1f} ms: {host}", flush=True)
 
     # ---------------- UI ----------------
     def _build_ui(self):
@@ -155,9 +333,10 @@ class IoTFrontend:
         conn.columnconfigure(5, weight=0)
 
         ttk.Label(conn, text="Host").grid(row=0, column=0, sticky="w", padx=(4,4), pady=4)
-        ips = [ip for _, ip in get_all_ipv4_addresses()]
+        # cached until the background discovery reports (_poll_net_discovery)
+        ips, self._cached_host = load_net_cache()
         self.host_e = ttk.Combobox(conn, values=ips, width=20)
-        self.host_e.set(detect_local_ip_dynamic())
+        self.host_e.set(self._cached_host)
         self.host_e.grid(row=0, column=1, sticky="w", padx=(0,8))
 
         ttk.Label(conn, text="Port").grid(row=0, column=2, sticky="w", padx=(4,4))
@@ -186,8 +365,13 @@ class IoTFrontend:
         btn_frame = ttk.Frame(conn)
         btn_frame.grid(row=2, column=0, columnspan=7, sticky="w", pady=(6,2))
         ttk.Button(btn_frame, text="Connect", command=self.toggle_connect).pack(side="left")
-        ttk.Button(btn_frame, text="Export CSV", command=self.export_csv).pack(side="left", padx=6)
+        ttk.Button(btn_frame, text="Export...", command=self.export_csv).pack(side="left", padx=6)
         ttk.Button(btn_frame, text="Clear Data", command=self.clear_data).pack(side="left")
+        ttk.Button(btn_frame, text="Perf", command=self.toggle_perf_panel).pack(side="left", padx=6)
+        self.history_btn = ttk.Button(btn_frame, text="History", command=self.toggle_history)
+        self.history_btn.pack(side="left")
+        self.frame_lbl = ttk.Label(btn_frame, text="", foreground="grey")
+        self.frame_lbl.pack(side="left", padx=(12,0))
 
         # ---------- Middle row: left = data display, right = terminal/log ----------
         mid = ttk.Frame(self.main)
@@ -195,6 +379,7 @@ class IoTFrontend:
         # set mid not to expand vertically (prevents terminal from pushing plots)
         mid.columnconfigure(0, weight=1)
         mid.columnconfigure(1, weight=1)
+        mid.columnconfigure(2, weight=1)
         mid.rowconfigure(0, weight=0)
 
         # Left: Current Readings (compact)
@@ -203,6 +388,8 @@ class IoTFrontend:
         data_frame.columnconfigure(1, weight=1)
 
         font = 12
+        self.device_lbl = ttk.Label(data_frame, text=self.selected, foreground="grey")
+        self.device_lbl.grid(row=3, column=0, columnspan=2, sticky="w", padx=6, pady=(0,6))
         ttk.Label(data_frame, text="Temperature (°C):").grid(row=0, column=0, sticky="w", padx=6, pady=6)
         self.temp_val = ttk.Label(data_frame, text="—", font=("Segoe UI", font, "bold"))
         self.temp_val.grid(row=0, column=1, sticky="w", padx=7, pady=6)
@@ -215,21 +402,39 @@ class IoTFrontend:
         self.gas_val = ttk.Label(data_frame, text="—", font=("Segoe UI", font, "bold"))
         self.gas_val.grid(row=2, column=1, sticky="w", padx=7, pady=6)
 
+        # Centre: all devices seen so far; selecting one switches readings + plots
+        dev_frame = ttk.LabelFrame(mid, text="Devices")
+        dev_frame.grid(row=0, column=1, sticky="nsew", padx=(0,5))
+        dev_frame.columnconfigure(0, weight=1)
+        cols = ("temp", "hum", "gas", "msgs", "seen")
+        self.dev_tree = ttk.Treeview(dev_frame, columns=cols, height=4, selectmode="browse")
+        self.dev_tree.heading("#0", text="Device")
+        self.dev_tree.column("#0", width=80)
+        for c, title, w in zip(cols, ("°C", "%", "Gas", "Msgs", "Last seen"), (50, 50, 50, 55, 70)):
+            self.dev_tree.heading(c, text=title)
+            self.dev_tree.column(c, width=w, anchor="e")
+        self.dev_tree.grid(row=0, column=0, sticky="nsew")
+        dev_scroll = ttk.Scrollbar(dev_frame, orient="vertical", command=self.dev_tree.yview)
+        dev_scroll.grid(row=0, column=1, sticky="ns")
+        self.dev_tree['yscrollcommand'] = dev_scroll.set
+        self.dev_tree.bind("<<TreeviewSelect>>", self._on_device_select)
+        self.dev_tree.tag_configure("alert", foreground="red")
+
         # Right: Terminal / Log (short height so plots remain visible)
         log_frame = ttk.LabelFrame(mid, text="Terminal / Log (short)")
-        log_frame.grid(row=0, column=1, sticky="nsew")
-        log_frame.rowconfigure(0, weight=0)  # keep log compact
+        log_frame.grid(row=0, column=2, sticky="nsew")
+        log_frame.rowconfigure(1, weight=0)  # keep log compact
         log_frame.columnconfigure(0, weight=1)
 
-        # IMPORTANT: small height (6 lines) so it doesn't push plots off screen
-        self.log = tk.Text(log_frame, height=5, state="disabled", font=("Consolas", 10))
-        self.log.grid(row=0, column=0, sticky="nsew")
-        log_scroll = ttk.Scrollbar(log_frame, orient="vertical", command=self.log.yview)
-        log_scroll.grid(row=0, column=1, sticky="ns")
-        self.log['yscrollcommand'] = log_scroll.set
+        # IMPORTANT: small height so it doesn't push plots off screen
+        # (bounded ring buffer + batched redraws, see logpanel.py)
+        self.log = LogPanel(self.root, log_frame, height=4)
 
     # ---------------- PLOT (bottom, two side-by-side) ----------------
     def _build_plot(self):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
         plots_frame = ttk.Frame(self.main)
         plots_frame.grid(row=2, column=0, sticky="nsew")
         plots_frame.rowconfigure(0, weight=1)
@@ -243,66 +448,228 @@ class IoTFrontend:
         self.ax_hum = self.ax_left.twinx()  # twin axis for humidity
         self.ax_right = self.fig.add_subplot(122)
 
-        self.canvas = FigureCanvasTkAgg(self.fig, master=plots_frame)
-        self.canvas_widget = self.canvas.get_tk_widget()
-        self.canvas_widget.grid(row=0, column=0, columnspan=2, sticky="nsew", padx=4, pady=4)
-
-    def _update_plot(self):
-        now = time.time()
-
-        def series_to_xy(buf):
-            if not buf:
-                return [], []
-            xs = [now - t for (t, v) in buf]
-            ys = [v for (t, v) in buf]
-            return xs, ys
-
-        tx, ty = series_to_xy(self.temp_buf)
-        hx, hy = series_to_xy(self.hum_buf)
-        gx, gy = series_to_xy(self.gas_buf)
-
-        # clear axes
-        self.ax_left.cla()
-        self.ax_hum.cla()
-        self.ax_right.cla()
-
-        # left: temperature (red), humidity (solid blue) on twin y
-        
+        # static decorations are set up once; _update_plot only moves the lines
         self.ax_left.grid(True, alpha=0.25)
-        if ty:
-            self.ax_left.plot(tx, ty, color='red', linewidth=2.5, label="Temp (°C)")
         self.ax_left.set_ylabel("°C")
         self.ax_left.set_title("Temperature & Humidity")
-
-        
-        if hy:
-            self.ax_hum.plot(hx, hy, color='blue', linewidth=2.2, label="Humidity (%)")
         self.ax_hum.set_ylabel("%")
-
-        # combined legend
-        lines1, labels1 = self.ax_left.get_legend_handles_labels()
-        lines2, labels2 = self.ax_hum.get_legend_handles_labels()
-        if lines1 or lines2:
-            self.ax_left.legend(lines1 + lines2, labels1 + labels2, loc="upper right")
-
-        # right: gas (grey)
-        
         self.ax_right.grid(True, alpha=0.25)
-        if gy:
-            self.ax_right.plot(gx, gy, color='grey', linewidth=2.0, label="Gas (raw)")
         self.ax_right.set_title("Gas (raw)")
         self.ax_right.set_xlabel("Seconds ago")
         self.ax_right.set_ylabel("Value")
-        if gy:
-            self.ax_right.legend(loc="upper right")
+
+        # animated artists are skipped by a full draw and blitted on top of the cached background
+        self.temp_line, = self.ax_left.plot([], [], color='red', linewidth=2.5,
+                                            label="Temp (°C)", animated=PLOT_BLIT)
+        self.hum_line, = self.ax_hum.plot([], [], color='blue', linewidth=2.2,
+                                          label="Humidity (%)", animated=PLOT_BLIT)
+        self.gas_line, = self.ax_right.plot([], [], color='grey', linewidth=2.0,
+                                            label="Gas (raw)", animated=PLOT_BLIT)
+        # legend lives on the twin (top) axis so humidity doesn't hide it
+        self.ax_hum.legend([self.temp_line, self.hum_line], ["Temp (°C)", "Humidity (%)"],
+                           loc="upper right")
+        self.ax_right.legend(loc="upper right")
 
         self.fig.subplots_adjust(left=0.06, right=0.97, top=0.92, bottom=0.12, wspace=0.25)
 
+        # (line, axis) pairs that share rescaling logic
+        self._plot_lines = [
+            (self.temp_line, self.ax_left),
+            (self.hum_line, self.ax_hum),
+            (self.gas_line, self.ax_right),
+        ]
+        self._plot_bg = None
+        self._draw_requested = None   # perf: when the last full redraw was asked for
+        self.frame_ms = 0.0       # smoothed cost of one _update_plot
+        self.frame_ms_max = 0.0
+        self._frame_lbl_at = 0.0
+
+        self.canvas = FigureCanvasTkAgg(self.fig, master=plots_frame)
+        self.canvas_widget = self.canvas.get_tk_widget()
+        self.canvas_widget.grid(row=0, column=0, columnspan=2, sticky="nsew", padx=4, pady=4)
+        self.canvas.mpl_connect("draw_event", self._on_draw)
+        # pan (drag) and zoom (wheel) only act in History mode
+        self.canvas.mpl_connect("scroll_event", self._on_hist_scroll)
+        self.canvas.mpl_connect("button_press_event", self._on_hist_press)
+        self.canvas.mpl_connect("motion_notify_event", self._on_hist_drag)
+        self.canvas.mpl_connect("button_release_event", self._on_hist_release)
+
+    def _on_draw(self, event):
+        if self._draw_requested is not None:
+            # draw_idle() only schedules; this is when the full redraw actually finished
+            perf.observe("plot.draw", time.perf_counter() - self._draw_requested)
+            self._draw_requested = None
+        if PLOT_BLIT:
+            # every full redraw (resize, rescale) refreshes the cached background
+            self._plot_bg = self.canvas.copy_from_bbox(self.fig.bbox)
+            self._blit_lines()
+
+    def _blit_lines(self):
+        for line, ax in self._plot_lines:
+            ax.draw_artist(line)
+        self.canvas.blit(self.fig.bbox)
+
+    def _update_plot(self):
+        if self.canvas is None:
+            return
+        if self.hist_range is not None:
+            self._update_history_plot()
+            return
+        t0 = time.perf_counter()
+        # replay: "now" is the newest replayed reading, so the plot scrolls with the data
+        now = self.replay.clock() if self.replay is not None else time.time()
+
+        dev = self.devices.get(self.selected)
+        decs = dev.decimators if dev else (None, None, None)
+        t_from = now - PLOT_WINDOW_S if PLOT_WINDOW_S else None
+
+        rescale = False
+        xmax = 0.0
+        for (line, ax), dec in zip(self._plot_lines, decs):
+            if dec is None:
+                line.set_data([], [])
+                continue
+            # reduced to ~1 point per pixel column (see series.Decimator)
+            ts, ys = dec.get(t_from, now, ax.bbox.width)
+            xs = now - ts
+            line.set_data(xs, ys)
+            if len(ys):
+                xmax = max(xmax, xs[0])
+                rescale |= self._fit_ylim(ax, ys.min(), ys.max())
+
+        # x is "seconds ago": grow with headroom so the limit isn't bumped on every frame
+        lo, hi = self.ax_left.get_xlim()
+        if xmax > hi or (hi > 10 and xmax < hi * 0.5):
+            new_hi = max(xmax * 1.25, 10.0)
+            self.ax_left.set_xlim(0, new_hi)
+            self.ax_right.set_xlim(0, new_hi)
+            rescale = True
+
+        if not PLOT_BLIT or rescale or self._plot_bg is None:
+            # full redraw; with blitting the draw_event re-caches the background
+            if perf.enabled and self._draw_requested is None:
+                self._draw_requested = time.perf_counter()
+            self.canvas.draw_idle()
+        else:
+            t_blit = time.perf_counter()
+            self.canvas.restore_region(self._plot_bg)
+            self._blit_lines()
+            if perf.enabled:
+                perf.observe("plot.blit", time.perf_counter() - t_blit)
+
+        if perf.enabled:
+            perf.observe("plot.update", time.perf_counter() - t0)
+        ms = (time.perf_counter() - t0) * 1000.0
+        self.frame_ms = ms if not self.frame_ms else self.frame_ms * 0.9 + ms * 0.1
+        self.frame_ms_max = max(self.frame_ms_max, ms)
+        if time.monotonic() - self._frame_lbl_at >= 1.0:
+            self._frame_lbl_at = time.monotonic()
+            self.labels.set(self.frame_lbl, f"plot {self.frame_ms:.1f} ms/frame")
+
+    @staticmethod
+    def _fit_ylim(ax, ymin, ymax):
+        # returns True when the y limits had to change
+        lo, hi = ax.get_ylim()
+        pad = max((ymax - ymin) * 0.1, abs(ymax) * 0.01, 0.5)
+        want = (ymax - ymin) + 2 * pad
+        if lo <= ymin and ymax <= hi and want >= (hi - lo) * 0.25:
+            return False
+        ax.set_ylim(ymin - pad, ymax + pad)
+        return True
+
+    # ---------------- HISTORY (pan/zoom over the database) ----------------
+    def toggle_history(self):
+        if self.canvas is None:
+            return
+        import matplotlib.dates as mdates
+        axes = (self.ax_left, self.ax_right)
+        if self.hist_range is None:
+            if self.history is None:
+                self.history = HistoryLoader(self.db_path, raw_days=self.raw_days)
+                self.history.start()
+                perf.add_source("history", self.history.stats)
+            now = time.time()
+            self.hist_range = (now - HISTORY_SPAN_S, now)
+            self._live_xaxis = [(ax.xaxis.get_major_locator(), ax.xaxis.get_major_formatter()) for ax in axes]
+            tz = datetime.datetime.now().astimezone().tzinfo
+            for ax in axes:
+                locator = mdates.AutoDateLocator(tz=tz)
+                ax.xaxis.set_major_locator(locator)
+                ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator, tz=tz))
+            self.ax_right.set_xlabel("")
+            self.history_btn.config(text="Live")
+            self._log("SYS", "History mode: drag to pan, mouse wheel to zoom")
+        else:
+            self.hist_range = None
+            for ax, (locator, formatter) in zip(axes, self._live_xaxis):
+                ax.xaxis.set_major_locator(locator)
+                ax.xaxis.set_major_formatter(formatter)
+                ax.set_xlim(0, 10)
+            self.ax_right.set_xlabel("Seconds ago")
+            self.history_btn.config(text="History")
+        self._request_frame()
+        self.canvas.draw_idle()
+
+    def _update_history_plot(self):
+        t0, t1 = self.hist_range
+        width = self.ax_left.bbox.width
+        data = self.history.view(self.selected, HISTORY_CHANNELS, t0, t1, width)
+        x0 = self._date_num(0.0)
+        for (line, ax), channel in zip(self._plot_lines, HISTORY_CHANNELS):
+            ts, ys = data[channel]
+            line.set_data(x0 + ts / 86400.0, ys)
+            if len(ys):
+                self._fit_ylim(ax, ys.min(), ys.max())
+        for ax in (self.ax_left, self.ax_right):
+            ax.set_xlim(x0 + t0 / 86400.0, x0 + t1 / 86400.0)
         self.canvas.draw_idle()
 
+    @staticmethod
+    def _date_num(ts):
+        # matplotlib date number of an epoch timestamp (honours a custom mpl date epoch)
+        import matplotlib.dates as mdates
+        return mdates.date2num(datetime.datetime.fromtimestamp(ts, datetime.timezone.utc))
+
+    def _hist_time(self, event):
+        # epoch seconds under the mouse, or None outside the plots
+        if event.inaxes is None or event.xdata is None:
+            return None
+        return (event.xdata - self._date_num(0.0)) * 86400.0
+
+    def _on_hist_scroll(self, event):
+        at = self._hist_time(event) if self.hist_range else None
+        if at is None:
+            return
+        t0, t1 = self.hist_range
+        f = 1 / HISTORY_ZOOM if event.button == "up" else HISTORY_ZOOM
+        # keep the time under the cursor in place; no closer than a minute
+        f = max(f, 60.0 / (t1 - t0))
+        self.hist_range = (at - (at - t0) * f, at + (t1 - at) * f)
+        self._request_frame()
+
+    def _on_hist_press(self, event):
+        if self.hist_range and event.button == 1 and event.inaxes is not None:
+            self._hist_drag = (event.x, self.hist_range)
+
+    def _on_hist_drag(self, event):
+        if self._hist_drag is None or self.hist_range is None:
+            return
+        x, (t0, t1) = self._hist_drag
+        dt = (x - event.x) * (t1 - t0) / max(self.ax_left.bbox.width, 1)
+        self.hist_range = (t0 + dt, t1 + dt)
+        self._request_frame()
+
+    def _on_hist_release(self, event):
+        self._hist_drag = None
+
     # ---------------- MQTT ----------------
+    @property
+    def connected(self):
+        return self.mqtt is not None and self.mqtt.connected
+
     def toggle_connect(self):
-        if self.connected:
+        # a started connection keeps retrying on its own; the button stops it
+        if self.mqtt is not None:
             self._disconnect()
         else:
             self._connect()
@@ -319,188 +686,385 @@ class IoTFrontend:
             messagebox.showerror("Missing settings", "Host and Topic required")
             return
 
-        try:
-            # clean up existing client if present
-            if self.mqtt_client:
-                try:
-                    self.mqtt_client.loop_stop()
-                    self.mqtt_client.disconnect()
-                except:
-                    pass
-                self.mqtt_client = None
-                self.connected = False
-
-            client_id = f"iot-frontend-{int(time.time())}"
-            client = mqtt.Client(client_id=client_id, clean_session=True)
-            user = self.user_e.get().strip()
-            pwd = self.pass_e.get()
-            if user:
-                client.username_pw_set(user, pwd)
-
-            client.on_connect = self._on_connect
-            client.on_disconnect = self._on_disconnect
-            client.on_message = self._on_message
-
-            client.connect(host, port, keepalive=60)
-            client.loop_start()
-
-            self.mqtt_client = client
-            self.status_lbl.config(text="Connecting...", foreground="orange")
-            self._log("SYS", f"Connect issued to {host}:{port}")
-        except Exception as e:
-            messagebox.showerror("Connect failed", str(e))
-            self._log("SYS", f"Connect failed: {e}")
+        if self.mqtt is not None:
+            self.mqtt.stop()
+        # connect/retry runs on the connection's own thread; the UI never blocks on it.
+        # The read-only viewer uses a throwaway session so it doesn't make the broker
+        # queue messages for it while it is closed.
+        role = "viewer" if self.read_only else "frontend"
+        self.mqtt = MqttConnection(host, port, topic, self._on_message,
+                                   user=self.user_e.get().strip() or None, password=self.pass_e.get(),
+                                   client_id=default_client_id(role), clean_session=self.read_only)
+        self.mqtt.start()
+        self._mqtt_state = None
+        self._log("SYS", f"Connecting to {host}:{port}")
 
     def _disconnect(self):
-        try:
-            if self.mqtt_client:
-                self.mqtt_client.loop_stop()
-                self.mqtt_client.disconnect()
-        except:
-            pass
-        self.mqtt_client = None
-        self.connected = False
-        self.status_lbl.config(text="Disconnected", foreground="red")
-        self._log("SYS", "Disconnected")
+        if self.mqtt is not None:
+            self.mqtt.stop()
+            st = self.mqtt.stats()
+            self._log("SYS", f"Disconnected ({st['reconnects']} reconnects, "
+                             f"{st['downtime_s']:.0f} s down this session)")
+        self.mqtt = None
+        self._mqtt_state = None
+        self.labels.set(self.status_lbl, "Disconnected", foreground="red")
+
+    def _poll_mqtt(self):
+        # state changes arrive from the connection thread; only touch Tk here
+        if self.mqtt is None:
+            return
+        while not self.mqtt.events.empty():
+            self._log("SYS", self.mqtt.events.get())
+        st = self.mqtt.stats()
+        key = (st["state"], st["reconnects"])
+        if key == self._mqtt_state:
+            return
+        self._mqtt_state = key
+        if st["state"] == "connected":
+            text = "Connected"
+            if st["reconnects"]:
+                text += f" ({st['reconnects']} reconnects)"
+            self.labels.set(self.status_lbl, text, foreground="green")
+        elif st["state"] == "backoff":
+            self.labels.set(self.status_lbl, "Reconnecting...", foreground="orange")
+        else:
+            self.labels.set(self.status_lbl, "Connecting...", foreground="orange")
 
-    def _on_connect(self, client, userdata, flags, rc):
-        try:
-            client.subscribe(self.topic_e.get().strip())
-            self._log("SYS", f"Subscribed to {self.topic_e.get().strip()}")
-            self.connected = True
-            self.status_lbl.config(text="Connected", foreground="green")
-        except Exception as e:
-            self._log("SYS", f"Subscribe failed: {e}")
-
-    def _on_disconnect(self, client, userdata, rc):
-        self._log("SYS", "MQTT disconnected")
-        self.connected = False
-        self.status_lbl.config(text="Disconnected", foreground="red")
+    def _publish_alert(self, a):
+        # ingest thread; paho's publish is thread safe. Replayed alerts stay local.
+        if self.mqtt is not None and self.replay is None:
+            self.mqtt.publish(ALERT_TOPIC_FMT.format(device=a.device), alert_payload(a), qos=1)
 
     def _on_message(self, client, userdata, msg):
-        try:
-            payload = msg.payload.decode("utf-8", errors="replace")
-        except Exception:
-            payload = str(msg.payload)
-        self.msg_q.put((time.time(), msg.topic, payload))
+        if self.read_only:
+            # the recorder stores these; DbTail shows them once they are in the DB
+            return
+        if perf.enabled:
+            t0 = time.perf_counter()
+            self.ingest.submit(time.time(), msg.topic, msg.payload)
+            perf.observe("mqtt.on_message", time.perf_counter() - t0)
+        else:
+            self.ingest.submit(time.time(), msg.topic, msg.payload)
 
     # ---------------- DATA POLLING & DB ----------------
     def _poll_queue(self):
-        updated = False
-        while not self.msg_q.empty():
-            ts, topic, payload = self.msg_q.get()
-            self._log(topic, payload)
-
-            obj = None
-            try:
-                obj = json.loads(payload)
-            except Exception:
-                # skip non-json payloads for plotting/storing
-                continue
-
-            t = obj.get("temperature")
-            h = obj.get("humidity")
-            g = obj.get("gas_raw")
-
-            if isinstance(t, (int, float)):
-                self.temp_buf.append((ts, t))
-                self.temp_val.config(text=f"{t:.1f}")
-            if isinstance(h, (int, float)):
-                self.hum_buf.append((ts, h))
-                self.hum_val.config(text=f"{h:.1f}")
-            if isinstance(g, (int, float)):
-                self.gas_buf.append((ts, g))
-                self.gas_val.config(text=str(int(round(g))))
-
-            # self.last_update.config(text=time.strftime("%F %T", time.localtime(ts)))
-
-            # write to DB
-            try:
-                self.db_cursor.execute(
-                    f"""
-                    INSERT INTO {self.table_name}
-                    (timestamp, topic, temperature, humidity, gas, payload)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        time.strftime("%F %T", time.localtime(ts)),
-                        topic,
-                        t,
-                        h,
-                        g,
-                        payload
-                    )
-                )
-
-                self.db.commit()
-            except Exception as e:
-                self._log("DB", f"DB write error: {e}")
-
-            updated = True
-
-        if updated:
+        """One frame: drain the ingest outbox, then redraw what changed. True if anything did."""
+        t0 = time.perf_counter()
+        upd = self.ingest.drain()
+        busy = bool(upd.readings or upd.logs or upd.alerts or self._plot_dirty)
+
+        if upd.logs_skipped:
+            self.log.suppress(upd.logs_skipped)
+        for ts, topic, payload in upd.logs:
+            self.log.add("DATA", topic, payload, ts)
+
+        for r in upd.readings:
+            dev = self.devices.get(r.device)
+            if dev is None:
+                dev = self.devices[r.device] = DeviceSeries(r.device, MAX_POINTS)
+                if self.selected not in self.devices:
+                    # nothing from the default device yet: follow the first one that talks
+                    self.selected = r.device
+            dev.add(r.ts, r.temperature, r.humidity, r.gas)
+            self._devices_dirty.add(r.device)
+
+        for a in upd.alerts:
+            self._log(a.device, describe_alert(a), a.ts, level="ALERT")
+            active = self.active_alerts.setdefault(a.device, set())
+            if a.state == "raised":
+                active.add(a.rule)
+            else:
+                active.discard(a.rule)
+            self._devices_dirty.add(a.device)
+
+        if self.api is not None:
+            self.api.publish(upd.readings, upd.alerts)
+
+        # labels and plot only follow the selected device; however many readings
+        # arrived, they are drawn once per frame
+        if self.selected in self._devices_dirty or self._plot_dirty:
+            self._plot_dirty = False
+            self._show_readings()
             self._update_plot()
 
-        self.root.after(POLL_MS, self._poll_queue)
+        if self._devices_dirty and time.monotonic() >= self._devices_refresh_at:
+            self._devices_refresh_at = time.monotonic() + DEVICE_REFRESH_S
+            self._refresh_device_list()
+
+        self._poll_mqtt()
+        self._poll_db_writer()
+        if self.history is not None:
+            while not self.history.errors.empty():
+                self._log("DB", self.history.errors.get(), level="ERROR")
+            # tiles fetched in the background since the last poll
+            if self.history.poll() and self.hist_range is not None:
+                self._update_plot()
+                busy = True
+            # keep the frame rate up while tiles are still on their way
+            busy = busy or bool(self.history.pending())
+
+        if perf.enabled:
+            perf.observe("ui.poll", time.perf_counter() - t0)
+        return busy
+
+    def _request_frame(self):
+        # user input: redraw in the next frame rather than once per event
+        self._plot_dirty = True
+        if self.frames is not None:
+            self.frames.wake()
+
+    def _show_readings(self):
+        # labels only need the newest value of the batch
+        dev = self.devices.get(self.selected)
+        t = dev.temperature if dev else None
+        h = dev.humidity if dev else None
+        g = dev.gas_value if dev else None
+        self.labels.set(self.device_lbl, self.selected)
+        self.labels.set(self.temp_val, f"{t:.1f}" if t is not None else "—")
+        self.labels.set(self.hum_val, f"{h:.1f}" if h is not None else "—")
+        self.labels.set(self.gas_val, str(int(round(g))) if g is not None else "—")
+
+    def _refresh_device_list(self):
+        fmt = lambda v, f: f.format(v) if v is not None else "—"
+        for name in sorted(self._devices_dirty):
+            dev = self.devices[name]
+            values = (fmt(dev.temperature, "{:.1f}"), fmt(dev.humidity, "{:.1f}"),
+                      fmt(dev.gas_value, "{:.0f}"), dev.count,
+                      time.strftime("%H:%M:%S", time.localtime(dev.last_ts)))
+            tags = ("alert",) if self.active_alerts.get(name) else ()
+            if self.dev_tree.exists(name):
+                self.dev_tree.item(name, values=values, tags=tags)
+            else:
+                self.dev_tree.insert("", "end", iid=name, text=name, values=values, tags=tags)
+                if name == self.selected:
+                    self.dev_tree.selection_set(name)
+        self._devices_dirty.clear()
+
+    def _on_device_select(self, e=None):
+        sel = self.dev_tree.selection()
+        if not sel or sel[0] == self.selected:
+            return
+        self.selected = sel[0]
+        self._request_frame()
+
+    def _poll_db_writer(self):
+        # replay mode has neither a writer nor a tail
+        source = self.writer or self.db_tail
+        if source is not None:
+            while not source.errors.empty():
+                self._log("DB", source.errors.get(), level="ERROR")
+        if self.writer is not None:
+            while not self.writer.notices.empty():
+                self._log("DB", self.writer.notices.get())
+        if self.api is not None:
+            while not self.api.errors.empty():
+                self._log("API", self.api.errors.get(), level="ERROR")
+        if self.replay is not None:
+            while not self.replay.errors.empty():
+                self._log("SYS", self.replay.errors.get(), level="ERROR")
+            if self.replay.done.is_set() and self.replay.wall_s:
+                st = self.replay.stats()
+                self._log("SYS", f"Replay finished: {st['sent']} messages "
+                                 f"({st['replayed_s'] / 3600:.1f} h of data) in {st['wall_s']:.1f} s")
+                self.replay.wall_s = 0.0
+        if self.retention is not None:
+            while not self.retention.errors.empty():
+                self._log("DB", self.retention.errors.get(), level="ERROR")
+            while not self.retention.notices.empty():
+                self._log("DB", self.retention.notices.get())
+        if time.monotonic() >= self._db_stats_at:
+            self._db_stats_at = time.monotonic() + DB_STATS_S
+            if self.frame_ms_max:
+                self._log("SYS", f"plot {self.frame_ms:.1f} ms/frame avg, {self.frame_ms_max:.1f} ms max")
+                self.frame_ms_max = 0.0
+            if self.writer is None:
+                return
+            st = self.writer.stats()
+            now = time.monotonic()
+            t_prev, rows_prev = self._db_rows_seen
+            self._db_rows_seen = (now, st["rows"])
+            rate = (st["rows"] - rows_prev) / (now - t_prev)
+            if rate > 0:
+                self._log("DB", f"{rate:.1f} rows/s, flush {st['last_flush_ms']:.1f} ms "
+                                f"(max {st['max_flush_ms']:.1f} ms), {st['pending']} pending")
+            ist = self.ingest.stats()
+            if ist["dropped"] or ist["bad_payload"]:
+                self._log("SYS", f"ingest: {ist['received']} received, {ist['dropped']} dropped, "
+                                 f"{ist['bad_payload']} unparsable, {ist['queued']} queued")
+            if self.mqtt is not None:
+                mst = self.mqtt.stats()
+                if mst["reconnects"] or mst["failed_attempts"]:
+                    self._log("SYS", f"mqtt: {mst['reconnects']} reconnects, "
+                                     f"{mst['failed_attempts']} failed attempts, {mst['downtime_s']:.0f} s down")
 
     # ---------------- KEYS ----------------
     def _on_keypress(self, e):
-        if not self.connected or not self.mqtt_client:
+        if not self.connected:
             return
+        # commands go to whichever device is selected
+        cmd_topic = CMD_TOPIC_FMT.format(device=self.selected)
         ch = getattr(e, 'char', '')
         if ch == 't':
-            self.mqtt_client.publish(DEFAULT_CMD_TOPIC, f"INC:{TEMP_STEP}")
+            self.mqtt.publish(cmd_topic, f"INC:{TEMP_STEP}")
         elif ch == 'T':
-            self.mqtt_client.publish(DEFAULT_CMD_TOPIC, f"DEC:{TEMP_STEP}")
+            self.mqtt.publish(cmd_topic, f"DEC:{TEMP_STEP}")
         elif ch == 'h':
-            self.mqtt_client.publish(DEFAULT_CMD_TOPIC, f"HUM_INC:{HUM_STEP}")
+            self.mqtt.publish(cmd_topic, f"HUM_INC:{HUM_STEP}")
         elif ch == 'H':
-            self.mqtt_client.publish(DEFAULT_CMD_TOPIC, f"HUM_DEC:{HUM_STEP}")
+            self.mqtt.publish(cmd_topic, f"HUM_DEC:{HUM_STEP}")
 
     # ---------------- UTIL ----------------
     def export_csv(self):
-        fn = filedialog.asksaveasfilename(defaultextension=".csv")
-        if not fn:
+        # export dialog: device / time range / columns / format, runs as an ExportJob
+        if getattr(self, "_export_win", None) and self._export_win.winfo_exists():
+            self._export_win.lift()
             return
-        try:
-            rows = self.db_cursor.execute(
-                f"SELECT timestamp, topic, temperature, humidity, gas, payload FROM {self.table_name}"
-            ).fetchall()
-            with open(fn, "w", newline="") as f:
-                w = csv.writer(f)
-                w.writerow(["timestamp", "topic", "temperature", "humidity", "gas_raw", "payload"])
-                w.writerows(rows)
-            messagebox.showinfo("Exported", f"Saved to {fn}")
-        except Exception as e:
-            messagebox.showerror("Export failed", str(e))
+        win = self._export_win = tk.Toplevel(self.root)
+        win.title("Export data")
+        win.transient(self.root)
+        frm = ttk.Frame(win, padding=8)
+        frm.grid(sticky="nsew")
+
+        ttk.Label(frm, text="Device").grid(row=0, column=0, sticky="w", pady=2)
+        dev_cb = ttk.Combobox(frm, values=["(all)"] + sorted(self.devices), width=18)
+        dev_cb.set(self.selected if self.selected in self.devices else "(all)")
+        dev_cb.grid(row=0, column=1, sticky="w", pady=2)
+
+        ttk.Label(frm, text="From").grid(row=1, column=0, sticky="w", pady=2)
+        from_e = ttk.Entry(frm, width=20)
+        from_e.grid(row=1, column=1, sticky="w", pady=2)
+        ttk.Label(frm, text="To").grid(row=2, column=0, sticky="w", pady=2)
+        to_e = ttk.Entry(frm, width=20)
+        to_e.grid(row=2, column=1, sticky="w", pady=2)
+        ttk.Label(frm, text="YYYY-MM-DD[ HH:MM], blank = no limit", foreground="grey").grid(
+            row=3, column=0, columnspan=2, sticky="w")
+
+        cols_frm = ttk.LabelFrame(frm, text="Columns")
+        cols_frm.grid(row=4, column=0, columnspan=2, sticky="ew", pady=(6,2))
+        col_vars = {}
+        for i, c in enumerate(EXPORT_COLUMNS):
+            col_vars[c] = tk.BooleanVar(value=c in DEFAULT_EXPORT_COLUMNS)
+            ttk.Checkbutton(cols_frm, text=c, variable=col_vars[c]).grid(
+                row=i // 3, column=i % 3, sticky="w", padx=4)
+
+        ttk.Label(frm, text="Format").grid(row=5, column=0, sticky="w", pady=2)
+        fmt_cb = ttk.Combobox(frm, values=list(EXPORT_FORMATS), state="readonly", width=18)
+        fmt_cb.set("CSV")
+        fmt_cb.grid(row=5, column=1, sticky="w", pady=2)
+
+        bar = ttk.Progressbar(frm, length=260, mode="determinate")
+        bar.grid(row=6, column=0, columnspan=2, sticky="ew", pady=(8,2))
+        status = ttk.Label(frm, text="")
+        status.grid(row=7, column=0, columnspan=2, sticky="w")
+
+        def start():
+            try:
+                t_from, t_to = parse_time(from_e.get()), parse_time(to_e.get())
+            except ValueError as e:
+                messagebox.showerror("Bad time", str(e), parent=win)
+                return
+            columns = [c for c in EXPORT_COLUMNS if col_vars[c].get()]
+            if not columns:
+                messagebox.showerror("No columns", "Select at least one column", parent=win)
+                return
+            ext = EXPORT_FORMATS[fmt_cb.get()]
+            fn = filedialog.asksaveasfilename(parent=win, defaultextension=ext,
+                                              filetypes=[(fmt_cb.get(), "*" + ext)])
+            if not fn:
+                return
+            dev = dev_cb.get().strip()
+            job = ExportJob(fn, db_path=self.db_path, columns=columns, t_from=t_from, t_to=t_to,
+                            devices=None if dev in ("", "(all)") else [dev]).start()
+            go_btn.config(state="disabled")
+            win.protocol("WM_DELETE_WINDOW", job.cancel)
+            self._poll_export(job, win, bar, status)
+
+        go_btn = ttk.Button(frm, text="Export...", command=start)
+        go_btn.grid(row=8, column=1, sticky="e", pady=(6,0))
+
+    def _poll_export(self, job, win, bar, status):
+        if not job.finished:
+            if job.total:
+                bar.config(maximum=job.total, value=job.done)
+                status.config(text=f"{job.done} / {job.total} rows")
+            self.root.after(100, self._poll_export, job, win, bar, status)
+            return
+        win.destroy()
+        if job.error:
+            messagebox.showerror("Export failed", str(job.error))
+        elif job.cancel_event.is_set():
+            self._log("SYS", f"Export cancelled after {job.rows} rows")
+        else:
+            messagebox.showinfo("Exported", f"Saved {job.rows} rows to {job.out_path}")
+
+    # ---------------- PERF PANEL ----------------
+    def toggle_perf_panel(self):
+        if self.perf_win is not None:
+            self.root.after_cancel(self._perf_after)
+            self.perf_win.destroy()
+            self.perf_win = None
+            # keep timing only if it is also being dumped to a file
+            perf.enabled = bool(self.perf_dump)
+            return
+        perf.enabled = True
+        win = self.perf_win = tk.Toplevel(self.root)
+        win.title("Performance")
+        win.protocol("WM_DELETE_WINDOW", self.toggle_perf_panel)
+        win.bind("<F9>", lambda e: self.toggle_perf_panel())
+        self.perf_lbl = ttk.Label(win, text="collecting...", font=("Consolas", 9), justify="left")
+        self.perf_lbl.pack(fill="both", expand=True, padx=8, pady=8)
+        ttk.Button(win, text="Reset", command=perf.reset).pack(side="left", padx=8, pady=(0,8))
+        self._refresh_perf_panel()
+
+    def _refresh_perf_panel(self):
+        if self.perf_win is None:
+            return
+        self.perf_lbl.config(text=perf.format_table())
+        self._perf_after = self.root.after(PERF_PANEL_MS, self._refresh_perf_panel)
 
     def clear_data(self):
-        self.temp_buf.clear()
-        self.hum_buf.clear()
-        self.gas_buf.clear()
-        self._update_plot()
+        for dev in self.devices.values():
+            dev.clear()
+        self._request_frame()
+
+    def _log(self, topic, msg, ts=None, level="INFO"):
+        self.log.add(level, topic, msg, ts)
 
-    def _log(self, topic, msg):
-        timestr = time.strftime("%H:%M:%S", time.localtime(time.time()))
-        line = f"[{timestr}] {topic}: {msg}\n"
+    def _on_close(self):
+        perf.stop_dump()
+        if self.frames is not None:
+            self.frames.stop()
+        if self.history is not None:
+            self.history.stop()
         try:
-            self.log.configure(state="normal")
-            self.log.insert("end", line)
-            # keep log short: ensure it doesn't grow visually beyond the allocated small height
-            self.log.yview_moveto(1.0)
-            self.log.configure(state="disabled")
+            if self.api is not None:
+                self.api.stop()
         except Exception:
             pass
-
-    def _on_close(self):
+        # stop the source first so nothing is submitted to a stopped pipeline
         try:
-            self.db.close()
+            if self.replay:
+                self.replay.stop()
+            if self.mqtt:
+                self.mqtt.stop()
         except:
             pass
         try:
-            if self.mqtt_client:
-                self.mqtt_client.loop_stop()
-                self.mqtt_client.disconnect()
+            self.ingest.stop()
+        except Exception:
+            pass
+        try:
+            if self.retention:
+                self.retention.stop()
+            if self.db_tail:
+                self.db_tail.stop()
+            if self.writer:
+                self.writer.stop()
+        except Exception:
+            pass
+        try:
+            if self.db is not None:
+                self.db.close()
         except:
             pass
         self.root.destroy()
@@ -508,8 +1072,46 @@ class IoTFrontend:
 
 # ---------------- RUN ----------------
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Air sensor dashboard")
+    ap.add_argument("--profile-startup", action="store_true",
+                    help="print a per-phase startup timing breakdown")
+    ap.add_argument("--read-only", action="store_true",
+                    help="don't record; follow a database written by the headless recorder")
+    ap.add_argument("--db", default=DB_PATH, metavar="PATH",
+                    help=f"database to record into or follow (default: {DB_PATH})")
+    ap.add_argument("--headless", action="store_true",
+                    help="run the recorder without a GUI (see daemon.py --help)")
+    ap.add_argument("--perf-dump", metavar="PATH",
+                    help="time the hot paths and write them to PATH every few seconds "
+                         "(.prom/.txt = Prometheus text, otherwise JSON)")
+    ap.add_argument("--alert-rules", metavar="JSON",
+                    help="alert rules file (default: the rules in alerts.py)")
+    ap.add_argument("--api", metavar="[HOST:]PORT",
+                    help="serve a read-only HTTP/WebSocket API (see api.py), e.g. --api 8080")
+    ap.add_argument("--replay", metavar="SOURCE",
+                    help="replay a database or exported CSV through the dashboard instead of "
+                         "recording (see replay.py)")
+    ap.add_argument("--speed", type=float, default=1.0,
+                    help="--replay speed, x real time (0 = as fast as possible)")
+    ap.add_argument("--replay-device", action="append", metavar="NAME",
+                    help="only replay this device (repeatable)")
+    args = ap.parse_args()
+    replay = (args.replay, args.speed, args.replay_device) if args.replay else None
+    if replay and not os.path.exists(args.replay):
+        ap.error(f"--replay: {args.replay} not found")
+    try:
+        api_addr = parse_addr(args.api) if args.api else None
+    except ValueError:
+        ap.error("--api: expected [HOST:]PORT")
+    try:
+        rules = load_rules(args.alert_rules)
+    except (OSError, ValueError) as e:
+        ap.error(f"--alert-rules: {e}")
+
     root = tk.Tk()
     # start with a sensible window size that fits most laptop screens
     root.geometry("1150x700")
-    app = IoTFrontend(root)
+    app = IoTFrontend(root, profile_startup=args.profile_startup, read_only=args.read_only,
+                      perf_dump=args.perf_dump, alert_rules=rules, api_addr=api_addr,
+                      replay=replay, db_path=args.db)
     root.mainloop()
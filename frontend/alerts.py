@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Streaming alerts over the decoded readings (runs in the ingest thread).
+Per device and channel a few O(1) running statistics are kept:
+    EWMA baseline, rolling mean/stddev over the last WINDOW samples,
+    rate of change since the previous sample.
+Each rule turns one of them into a number and compares it with `raise`;
+the alert stays active until the number is back past `clear` (hysteresis)
+and only fires after `samples` consecutive hits (debounce).
+
+Rule kinds (value compared against raise/clear):
+    threshold   the reading itself
+    deviation   reading - EWMA baseline          (spike over a drifting baseline)
+    zscore      (reading - rolling mean) / rolling stddev
+    rate        change per minute since the previous reading
+
+Rules are a list of dicts, e.g. in a JSON file passed with --alert-rules:
+    [{"name": "gas_high", "channel": "gas", "kind": "threshold",
+      "raise": 3500, "clear": 3300, "direction": "above", "samples": 2}]
+"""
+
+import json, math, time
+from collections import deque, namedtuple
+
+# ---------------- CONFIG ----------------
+EWMA_ALPHA = 0.05        # baseline weight of a new sample (~20 sample memory)
+WINDOW = 60              # samples in the rolling mean/stddev (10 min at 10 s)
+WARMUP = 10              # samples per channel before deviation/zscore rules apply
+ALERT_TOPIC_FMT = "home/air/{device}/alert"
+
+DEFAULT_RULES = [
+    {"name": "gas_high", "channel": "gas", "kind": "threshold", "raise": 3500, "clear": 3300},
+    {"name": "gas_spike", "channel": "gas", "kind": "deviation", "raise": 500, "clear": 250},
+    {"name": "gas_anomaly", "channel": "gas", "kind": "zscore", "raise": 4.0, "clear": 2.0, "samples": 2},
+    {"name": "temp_high", "channel": "temperature", "kind": "threshold", "raise": 40.0, "clear": 38.0},
+    {"name": "temp_rate", "channel": "temperature", "kind": "rate", "raise": 2.0, "clear": 1.0},
+]
+# --------------------------------------
+
+KINDS = ("threshold", "deviation", "zscore", "rate")
+CHANNELS = ("temperature", "humidity", "gas")
+RULE_KEYS = {"name", "channel", "kind", "raise", "clear", "direction", "samples"}
+
+# state is "raised" or "cleared"; value is the rule's metric at that moment
+Alert = namedtuple("Alert", "ts device rule channel state value reading")
+
+
+class ChannelStats:
+    """Running statistics of one device channel; every update is O(1)."""
+
+    __slots__ = ("n", "ewma", "window", "wsum", "wsq", "last_ts", "last_v")
+
+    def __init__(self, window=WINDOW):
+        self.n = 0
+        self.ewma = None
+        self.window = deque(maxlen=window)
+        self.wsum = 0.0
+        self.wsq = 0.0
+        self.last_ts = None
+        self.last_v = None
+
+    def mean_std(self):
+        k = len(self.window)
+        if k < 2:
+            return None, None
+        mean = self.wsum / k
+        var = max(self.wsq / k - mean * mean, 0.0)
+        return mean, math.sqrt(var)
+
+    def update(self, ts, v, alpha):
+        self.n += 1
+        self.ewma = v if self.ewma is None else self.ewma + alpha * (v - self.ewma)
+        w = self.window
+        if len(w) == w.maxlen:
+            old = w[0]
+            self.wsum -= old
+            self.wsq -= old * old
+        w.append(v)
+        self.wsum += v
+        self.wsq += v * v
+        self.last_ts, self.last_v = ts, v
+
+
+class Rule:
+    def __init__(self, name, channel, kind, raise_, clear=None, direction="above", samples=1):
+        if channel not in CHANNELS:
+            raise ValueError(f"rule {name}: unknown channel {channel!r}")
+        if kind not in KINDS:
+            raise ValueError(f"rule {name}: unknown kind {kind!r}")
+        if direction not in ("above", "below"):
+            raise ValueError(f"rule {name}: direction must be 'above' or 'below'")
+        self.name, self.channel, self.kind = name, channel, kind
+        # "below" rules are evaluated on the negated metric so one comparison serves both
+        self.sign = 1.0 if direction == "above" else -1.0
+        self.raise_ = self.sign * float(raise_)
+        self.clear = self.sign * float(raise_ if clear is None else clear)
+        self.samples = max(int(samples), 1)
+
+    @classmethod
+    def from_dict(cls, d):
+        if not isinstance(d, dict):
+            raise ValueError(f"alert rule {d!r} is not an object")
+        unknown = set(d) - RULE_KEYS
+        if unknown:
+            raise ValueError(f"alert rule {d.get('name', d)!r}: unknown key(s) {', '.join(sorted(unknown))}")
+        d = dict(d)
+        try:
+            return cls(d.pop("name"), d.pop("channel"), d.pop("kind", "threshold"), d.pop("raise"), **d)
+        except KeyError as e:
+            raise ValueError(f"alert rule {d} is missing {e}")
+
+    def metric(self, st, ts, v):
+        """Value to compare for sample v, from stats *before* v is added; None = not yet."""
+        if self.kind == "threshold":
+            return v
+        if self.kind == "rate":
+            if st.last_ts is None or ts <= st.last_ts:
+                return None
+            return (v - st.last_v) / (ts - st.last_ts) * 60.0
+        if st.n < WARMUP:
+            return None
+        if self.kind == "deviation":
+            return v - st.ewma
+        mean, std = st.mean_std()
+        if not std:
+            return None
+        return (v - mean) / std
+
+
+def load_rules(path=None):
+    """Rules from a JSON file (list of dicts), or DEFAULT_RULES."""
+    if path:
+        with open(path) as f:
+            rules = json.load(f)
+    else:
+        rules = DEFAULT_RULES
+    return [Rule.from_dict(r) for r in rules]
+
+
+class AlertEngine:
+    def __init__(self, rules=None, alpha=EWMA_ALPHA, window=WINDOW):
+        rules = load_rules() if rules is None else rules
+        self.alpha = alpha
+        self.window = window
+        self.rules = rules
+        self._by_channel = {c: [r for r in rules if r.channel == c] for c in CHANNELS}
+        self._stats = {}     # (device, channel) -> ChannelStats
+        self._state = {}     # (device, rule name) -> [active, consecutive hits / misses]
+        self.evaluated = 0
+        self.raised = 0
+        self.cleared = 0
+
+    def process(self, r):
+        """Feed one Reading; returns the list of Alert state changes it caused."""
+        out = None
+        for channel, v in (("temperature", r.temperature), ("humidity", r.humidity), ("gas", r.gas)):
+            rules = self._by_channel[channel]
+            if v is None or not rules:
+                continue
+            key = (r.device, channel)
+            st = self._stats.get(key)
+            if st is None:
+                st = self._stats[key] = ChannelStats(self.window)
+            for rule in rules:
+                m = rule.metric(st, r.ts, v)
+                self.evaluated += 1
+                if m is None:
+                    continue
+                ev = self._step(r, rule, m)
+                if ev is not None:
+                    if out is None:
+                        out = []
+                    out.append(ev)
+            st.update(r.ts, v, self.alpha)
+        return out or ()
+
+    def _step(self, r, rule, m):
+        skey = (r.device, rule.name)
+        s = self._state.get(skey)
+        if s is None:
+            s = self._state[skey] = [False, 0]
+        m_signed = rule.sign * m
+        if not s[0]:
+            s[1] = s[1] + 1 if m_signed > rule.raise_ else 0
+            if s[1] >= rule.samples:
+                s[0], s[1] = True, 0
+                self.raised += 1
+                return Alert(r.ts, r.device, rule.name, rule.channel, "raised", m, getattr(r, rule.channel))
+        else:
+            s[1] = s[1] + 1 if m_signed < rule.clear else 0
+            if s[1] >= rule.samples:
+                s[0], s[1] = False, 0
+                self.cleared += 1
+                return Alert(r.ts, r.device, rule.name, rule.channel, "cleared", m, getattr(r, rule.channel))
+        return None
+
+    def active(self):
+        return sorted(k for k, s in self._state.items() if s[0])
+
+    def stats(self):
+        return {"evaluated": self.evaluated, "raised": self.raised, "cleared": self.cleared,
+                "active": sum(1 for s in self._state.values() if s[0]),
+                "series": len(self._stats)}
+
+
+def alert_payload(a):
+    """JSON for the MQTT alert topic."""
+    return json.dumps({"device": a.device, "rule": a.rule, "channel": a.channel, "state": a.state,
+                       "value": round(a.value, 3), "reading": a.reading,
+                       "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(a.ts))})
+
+
+def describe(a):
+    """One line for logs."""
+    verb = "ALERT" if a.state == "raised" else "cleared"
+    return f"{verb} {a.rule} on {a.device}: {a.channel} {a.reading} ({a.value:.2f})"
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+Read-only local HTTP/WebSocket API (stdlib asyncio, no extra dependencies).
+
+    GET /api/devices                         devices with their latest values
+    GET /api/latest?device=esp01             latest reading of one device
+    GET /api/readings?device=esp01&from=..&to=..[&resolution=auto|raw|1m|1h|1d][&points=1000]
+    GET /api/alerts?device=esp01[&from=..&to=..]
+    WS  /ws/live[?device=esp01,esp02]        live readings and alerts as JSON
+
+Times are epoch seconds. resolution=auto serves wide ranges from the rollup
+tables (about `points` buckets) and only narrow ones from raw readings.
+The live stream is fed by the owning process with publish(), from the same
+batches the dashboard plots; each WebSocket client has its own bounded queue
+and a slow client only loses its own oldest messages.
+The server runs its own event loop on a background thread; database queries
+run on one worker thread with a read-only connection.
+"""
+
+import asyncio, base64, concurrent.futures, hashlib, json, math, queue, struct, threading, time
+from urllib.parse import urlsplit, parse_qs
+
+from storage import DB_PATH, open_db
+from history import LEVELS, choose_level
+from retention import RAW_DAYS
+
+# ---------------- CONFIG ----------------
+API_HOST = "127.0.0.1"   # local only; put a reverse proxy in front to expose it
+API_PORT = 8080
+WS_QUEUE_MAX = 100       # batches buffered per WebSocket client before dropping the oldest
+MAX_ROWS = 100000        # cap on rows returned by one range query
+DEFAULT_POINTS = 1000
+HEADER_MAX = 16384
+# --------------------------------------
+
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+_RESOLUTIONS = {"raw": 0, "1m": 1, "1h": 2, "1d": 3}
+
+
+def parse_addr(s):
+    """'8080', ':8080' or 'host:8080' -> (host, port)."""
+    host, _, port = s.rpartition(":")
+    return host or API_HOST, int(port)
+
+
+class HttpError(Exception):
+    def __init__(self, status, msg):
+        super().__init__(msg)
+        self.status = status
+
+
+def _reading_dict(r):
+    return {"device": r.device, "ts": r.ts, "temperature": r.temperature,
+            "humidity": r.humidity, "gas_raw": r.gas}
+
+
+def _alert_dict(a):
+    return {"device": a.device, "ts": a.ts, "rule": a.rule, "channel": a.channel,
+            "state": a.state, "value": a.value, "reading": a.reading}
+
+
+# ---------------- queries (worker thread) ----------------
+def _float_arg(q, name, default=None, what="epoch seconds"):
+    v = q.get(name)
+    if v is None:
+        return default
+    try:
+        v = float(v)
+    except ValueError:
+        v = math.nan
+    if not math.isfinite(v):
+        raise HttpError(400, f"{name} must be {what}")
+    return v
+
+
+def query_devices(conn):
+    rows = conn.execute("""
+        SELECT d.name, r.ts_ms, r.temperature, r.humidity, r.gas
+        FROM devices d JOIN readings r ON r.id = (
+            SELECT id FROM readings WHERE device_id = d.id ORDER BY ts_ms DESC LIMIT 1)
+    """).fetchall()
+    return {name: {"device": name, "ts": ts_ms / 1000.0, "temperature": t, "humidity": h, "gas_raw": g}
+            for name, ts_ms, t, h, g in rows}
+
+
+def query_readings(conn, device, t0, t1, resolution="auto", points=DEFAULT_POINTS, raw_days=RAW_DAYS):
+    if resolution == "auto":
+        level = choose_level(t0, t1, points, raw_days)
+    elif resolution in _RESOLUTIONS:
+        level = _RESOLUTIONS[resolution]
+    else:
+        raise HttpError(400, f"resolution must be auto, {', '.join(_RESOLUTIONS)}")
+    table, bucket_s, _ = LEVELS[level]
+    if table is None:
+        rows = conn.execute(
+            "SELECT r.ts_ms / 1000.0, r.temperature, r.humidity, r.gas "
+            "FROM readings r JOIN devices d ON d.id = r.device_id "
+            "WHERE d.name = ? AND r.ts_ms >= ? AND r.ts_ms < ? ORDER BY r.ts_ms LIMIT ?",
+            (device, int(t0 * 1000), int(t1 * 1000), MAX_ROWS)).fetchall()
+        data = [{"ts": ts, "temperature": t, "humidity": h, "gas_raw": g} for ts, t, h, g in rows]
+        return {"device": device, "resolution": "raw", "truncated": len(rows) == MAX_ROWS, "data": data}
+    cols = ", ".join(f"{c}_n, {c}_min, {c}_max, {c}_sum" for c in ("t", "h", "g"))
+    rows = conn.execute(
+        f"SELECT bucket, n, {cols} FROM {table} WHERE device = ? AND bucket >= ? AND bucket < ? "
+        f"ORDER BY bucket LIMIT ?",
+        (device, int(t0 // bucket_s * bucket_s), int(t1), MAX_ROWS)).fetchall()
+    data = []
+    for row in rows:
+        item = {"ts": row[0], "n": row[1]}
+        for i, name in enumerate(("temperature", "humidity", "gas_raw")):
+            n, lo, hi, total = row[2 + 4 * i: 6 + 4 * i]
+            item[name] = {"min": lo, "max": hi, "mean": total / n} if n else None
+        data.append(item)
+    return {"device": device, "resolution": table.split("_", 1)[1], "bucket_s": bucket_s,
+            "truncated": len(rows) == MAX_ROWS, "data": data}
+
+
+def query_alerts(conn, device, t0, t1):
+    args, where = [], []
+    if device:
+        where.append("d.name = ?")
+        args.append(device)
+    where.append("a.ts_ms >= ? AND a.ts_ms < ?")
+    args += [int(t0 * 1000), int(t1 * 1000)]
+    rows = conn.execute(
+        "SELECT d.name, a.ts_ms, a.rule, a.channel, a.state, a.value, a.reading "
+        "FROM alerts a JOIN devices d ON d.id = a.device_id WHERE " + " AND ".join(where) +
+        " ORDER BY a.ts_ms LIMIT ?", args + [MAX_ROWS]).fetchall()
+    return [{"device": d, "ts": ts / 1000.0, "rule": rule, "channel": ch, "state": st,
+             "value": v, "reading": r} for d, ts, rule, ch, st, v, r in rows]
+
+
+# ---------------- WebSocket framing ----------------
+def _ws_frame(payload, opcode=0x1):
+    n = len(payload)
+    if n < 126:
+        head = struct.pack("!BB", 0x80 | opcode, n)
+    elif n < 65536:
+        head = struct.pack("!BBH", 0x80 | opcode, 126, n)
+    else:
+        head = struct.pack("!BBQ", 0x80 | opcode, 127, n)
+    return head + payload
+
+
+async def _ws_read_frame(reader):
+    b0, b1 = await reader.readexactly(2)
+    n = b1 & 0x7F
+    if n == 126:
+        n = struct.unpack("!H", await reader.readexactly(2))[0]
+    elif n == 127:
+        n = struct.unpack("!Q", await reader.readexactly(8))[0]
+    if n > HEADER_MAX:
+        raise ConnectionError("frame too large")
+    mask = await reader.readexactly(4) if b1 & 0x80 else None
+    data = await reader.readexactly(n)
+    if mask:
+        data = bytes(c ^ mask[i % 4] for i, c in enumerate(data))
+    return b0 & 0x0F, data
+
+
+class _Client:
+    def __init__(self, writer, devices):
+        self.writer = writer
+        self.devices = devices            # None = all
+        self.q = asyncio.Queue(WS_QUEUE_MAX)
+        self.dropped = 0
+
+
+class ApiServer:
+    def __init__(self, host=API_HOST, port=API_PORT, db_path=DB_PATH, raw_days=RAW_DAYS):
+        self.host, self.port, self.db_path = host, port, db_path
+        self.raw_days = raw_days      # retention's limit, for resolution=auto
+        self.errors = queue.Queue()
+        self.latest = {}          # device -> reading dict, from publish()
+        self.clients = set()
+        self.requests = 0
+        self.ws_sent = 0
+        self.ws_dropped = 0
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._db = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="api-db")
+        self._conn = None
+
+    # ---------------- owner API (any thread) ----------------
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="api", daemon=True)
+            self._thread.start()
+            self._ready.wait(5.0)
+
+    def stop(self):
+        loop = self._loop
+        if loop is not None and self._thread is not None:
+            try:
+                loop.call_soon_threadsafe(self._shutdown)
+            except RuntimeError:
+                pass        # loop already closed
+            else:
+                self._thread.join(5.0)
+        self._thread = None
+        self._db.shutdown(wait=False)
+
+    def publish(self, readings=(), alerts=()):
+        """Hand a batch of new readings/alerts to the live stream (cheap; returns at once)."""
+        if self._loop is not None and (readings or alerts) and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._fanout, list(readings), list(alerts))
+
+    def stats(self):
+        return {"clients": len(self.clients), "requests": self.requests,
+                "ws_sent": self.ws_sent, "ws_dropped": self.ws_dropped}
+
+    # ---------------- event loop thread ----------------
+    def _run(self):
+        loop = self._loop = asyncio.new_event_loop()
+        try:
+            self._server = loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port, limit=HEADER_MAX))
+        except OSError as e:
+            self.errors.put(f"API server could not listen on {self.host}:{self.port}: {e}")
+            self._loop = None
+            loop.close()
+            self._ready.set()
+            return
+        self._ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    def _shutdown(self):
+        self._server.close()
+        for c in list(self.clients):
+            c.writer.close()
+        # let open requests and WebSocket senders unwind before the loop stops
+        tasks = asyncio.all_tasks(self._loop)
+        for t in tasks:
+            t.cancel()
+        done = asyncio.gather(*tasks, return_exceptions=True)
+        done.add_done_callback(lambda _: self._loop.stop())
+
+    def _fanout(self, readings, alerts):
+        for r in readings:
+            self.latest[r.device] = _reading_dict(r)
+        for c in self.clients:
+            rs = [r for r in readings if c.devices is None or r.device in c.devices]
+            als = [a for a in alerts if c.devices is None or a.device in c.devices]
+            if not rs and not als:
+                continue
+            msg = {"type": "update", "readings": [_reading_dict(r) for r in rs],
+                   "alerts": [_alert_dict(a) for a in als]}
+            if c.q.full():
+                # backpressure: this client is behind, drop its oldest batch
+                c.q.get_nowait()
+                c.dropped += 1
+                self.ws_dropped += 1
+            c.q.put_nowait(msg)
+
+    async def _db_call(self, fn, *args):
+        def call():
+            if self._conn is None:
+                self._conn = open_db(self.db_path, readonly=True)
+            return fn(self._conn, *args)
+        return await self._loop.run_in_executor(self._db, call)
+
+    async def _handle(self, reader, writer):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            lines = head.decode("latin-1").split("\r\n")
+            try:
+                method, target, _ = lines[0].split(" ", 2)
+            except ValueError:
+                raise HttpError(400, "malformed request line")
+            headers = {}
+            for line in lines[1:]:
+                if ":" in line:
+                    k, v = line.split(":", 1)
+                    headers[k.strip().lower()] = v.strip()
+            self.requests += 1
+            url = urlsplit(target)
+            q = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            if method != "GET":
+                raise HttpError(405, "read-only API: GET only")
+            if url.path == "/ws/live":
+                await self._websocket(reader, writer, headers, q)
+                return
+            body = await self._route(url.path, q)
+            self._respond(writer, 200, body)
+        except HttpError as e:
+            self._respond(writer, e.status, {"error": str(e)})
+        except ValueError as e:
+            # bad query values that got past the checks in _route
+            self._respond(writer, 400, {"error": str(e) or "bad request"})
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            # server shutting down; end the task normally (a cancelled client task gets logged)
+            writer.close()
+            return
+        except Exception as e:
+            self.errors.put(f"API error: {e}")
+            self._respond(writer, 500, {"error": "internal error"})
+        try:
+            await writer.drain()
+            writer.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _respond(writer, status, body):
+        data = json.dumps(body, separators=(",", ":")).encode()
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                  500: "Internal Server Error"}.get(status, "")
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(data)}\r\nAccess-Control-Allow-Origin: *\r\n"
+                     f"Connection: close\r\n\r\n".encode() + data)
+
+    async def _route(self, path, q):
+        now = time.time()
+        if path == "/api/devices":
+            devices = await self._db_call(query_devices)
+            devices.update(self.latest)
+            return sorted(devices.values(), key=lambda d: d["device"])
+        if path == "/api/latest":
+            device = q.get("device")
+            if not device:
+                raise HttpError(400, "device is required")
+            if device in self.latest:
+                return self.latest[device]
+            found = (await self._db_call(query_devices)).get(device)
+            if found is None:
+                raise HttpError(404, f"unknown device {device}")
+            return found
+        if path == "/api/readings":
+            device = q.get("device")
+            if not device:
+                raise HttpError(400, "device is required")
+            t1 = _float_arg(q, "to", now)
+            t0 = _float_arg(q, "from", t1 - 86400)
+            points = int(_float_arg(q, "points", DEFAULT_POINTS, "a number"))
+            return await self._db_call(query_readings, device, t0, t1,
+                                       q.get("resolution", "auto"), max(points, 1), self.raw_days)
+        if path == "/api/alerts":
+            t1 = _float_arg(q, "to", now)
+            t0 = _float_arg(q, "from", t1 - 7 * 86400)
+            return await self._db_call(query_alerts, q.get("device"), t0, t1)
+        raise HttpError(404, f"no such endpoint {path}")
+
+    async def _websocket(self, reader, writer, headers, q):
+        key = headers.get("sec-websocket-key")
+        if headers.get("upgrade", "").lower() != "websocket" or not key:
+            raise HttpError(400, "WebSocket upgrade expected")
+        accept = base64.b64encode(hashlib.sha1((key + _WS_GUID).encode()).digest()).decode()
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                      f"Connection: Upgrade\r\nSec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        devices = set(q["device"].split(",")) if q.get("device") else None
+        client = _Client(writer, devices)
+        self.clients.add(client)
+        sender = asyncio.ensure_future(self._ws_send(client))
+        try:
+            # the client only ever sends pings and close; anything else is ignored
+            while True:
+                opcode, data = await _ws_read_frame(reader)
+                if opcode == 0x8:
+                    writer.write(_ws_frame(data[:2], 0x8))
+                    break
+                if opcode == 0x9:
+                    writer.write(_ws_frame(data, 0xA))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.clients.discard(client)
+            sender.cancel()
+            writer.close()
+
+    async def _ws_send(self, client):
+        try:
+            while True:
+                msg = await client.q.get()
+                if client.dropped:
+                    msg["dropped"] = client.dropped
+                    client.dropped = 0
+                client.writer.write(_ws_frame(json.dumps(msg, separators=(",", ":")).encode()))
+                self.ws_sent += 1
+                # a slow reader only stalls this task; _fanout keeps dropping its oldest batches
+                await client.writer.drain()
+        except (asyncio.CancelledError, ConnectionError):
+            pass
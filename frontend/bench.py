@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Load benchmark for the ingest -> storage -> plot path.
+Synthetic payloads in the firmware's format ({"temperature","humidity","gas_raw"},
+see src/main.cpp) are fed through the same code the dashboard runs:
+    on_message -> IngestPipeline -> SQLiteWriter (temporary database)
+                                 -> UI poll (drain, DeviceSeries, Decimator)
+Without --broker, messages are handed to on_message directly; with --broker they
+are published to a real broker and come back through MqttConnection.
+
+    python bench.py [--rate 2000] [--devices 10] [--duration 10] [--out run.json]
+    python bench.py --rate 0 --compare baseline.json      (0 = as fast as possible)
+    python bench.py --payload packed                      (compact binary, see decoders.py)
+
+Reports throughput, receive->UI and receive->commit latency percentiles, UI poll
+time, queue depths and RSS. --out saves the report as JSON; --compare prints the
+change against a saved report and exits 1 if a metric got worse by more than
+--tolerance.
+"""
+
+import argparse, json, os, platform, random, resource, sys, tempfile, threading, time
+from collections import namedtuple
+
+import numpy as np
+
+from storage import open_db, ensure_schema, SQLiteWriter
+from ingest import IngestPipeline
+from series import DeviceSeries
+from perf import perf
+from frames import MAX_FPS
+from decoders import encode_packed
+
+# ---------------- CONFIG ----------------
+TOPIC_FMT = "home/air/{device}/data"
+POLL_MS = 1000 / MAX_FPS   # the dashboard's frame interval while data is flowing
+PLOT_WIDTH = 800       # decimator width, roughly the plot's pixel width
+MAX_POINTS = 4320       # the dashboard's buffer size (IOTfrontend.MAX_POINTS)
+SAMPLE_MS = 100        # queue depth / RSS sampling interval
+TOLERANCE = 0.10       # --compare: relative change counted as a regression
+# --------------------------------------
+
+# metric -> True if bigger is better (used by --compare)
+METRICS = {
+    "throughput_msg_s": True,
+    "ui_latency_ms.p50": False,
+    "ui_latency_ms.p99": False,
+    "db_latency_ms.p50": False,
+    "db_latency_ms.p99": False,
+    "poll_ms.p99": False,
+    "flush_ms.max": False,
+    "queue.ingest_max": False,
+    "rss_mb.peak": False,
+}
+
+_Msg = namedtuple("_Msg", "topic payload")
+
+
+def make_payload(rng, fmt="json"):
+    t, h, g = rng.uniform(18, 30), rng.uniform(30, 70), rng.randint(100, 900)
+    if fmt == "packed":
+        return encode_packed([(0, t, h, g)], 0)
+    return ('{"temperature":%.1f,"humidity":%.1f,"gas_raw":%d}' % (t, h, g)).encode()
+
+
+def percentiles(samples):
+    if not len(samples):
+        return {"p50": None, "p90": None, "p99": None, "max": None}
+    p50, p90, p99 = np.percentile(samples, (50, 90, 99))
+    return {"p50": float(p50), "p90": float(p90), "p99": float(p99), "max": float(np.max(samples))}
+
+
+def rss_mb():
+    # current resident set from /proc where available, else the peak
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return kb / 2**20 if sys.platform == "darwin" else kb / 2**10
+
+
+class _TimedWriter(SQLiteWriter):
+    """SQLiteWriter that records receive->commit latency of every row."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+
+    def _flush(self, conn, batch, alerts=()):
+        super()._flush(conn, batch, alerts)
+        now = time.time()
+        self.latencies.extend((now - ts) * 1000 for _, ts, _ in batch)
+
+
+class Bench:
+    def __init__(self, db_path, devices, rate, duration, broker=None, drop_policy="oldest",
+                 payload="json"):
+        self.devices = [f"bench{i:02d}" for i in range(devices)]
+        self.payload = payload
+        self.rate = rate
+        self.duration = duration
+        self.broker = broker
+
+        conn = open_db(db_path)
+        ensure_schema(conn)
+        conn.close()
+        self.writer = _TimedWriter(db_path)
+        self.ingest = IngestPipeline(self.writer, drop_policy=drop_policy)
+        self.mqtt = None
+
+        self.sent = 0
+        self.series = {}
+        self.ui_latencies = []
+        self.poll_ms = []
+        self.ingest_depth = []
+        self.writer_depth = []
+        self.rss = []
+        self._stop = threading.Event()
+
+    # same as IoTFrontend._on_message / Recorder._on_message
+    def _on_message(self, client, userdata, msg):
+        self.ingest.submit(time.time(), msg.topic, msg.payload)
+
+    # ---------------- producer ----------------
+    def _produce(self, send):
+        rng = random.Random(1)
+        topics = [TOPIC_FMT.format(device=d) for d in self.devices]
+        t0 = time.perf_counter()
+        end = t0 + self.duration
+        while True:
+            now = time.perf_counter()
+            if now >= end:
+                break
+            if self.rate:
+                # catch up to where the schedule says we should be, in 1 ms steps
+                due = int((now - t0) * self.rate) - self.sent
+                if due <= 0:
+                    time.sleep(0.001)
+                    continue
+            else:
+                due = 100
+            for _ in range(due):
+                send(topics[self.sent % len(topics)], make_payload(rng, self.payload))
+                self.sent += 1
+        return time.perf_counter() - t0
+
+    def _send_direct(self, topic, payload):
+        self._on_message(None, None, _Msg(topic, payload))
+
+    # ---------------- consumer (emulates the dashboard's poll loop) ----------------
+    def _poll(self):
+        selected = self.devices[0]
+        while not self._stop.wait(POLL_MS / 1000.0):
+            self._poll_once(selected)
+        self._poll_once(selected)
+
+    def _poll_once(self, selected):
+        t0 = time.perf_counter()
+        upd = self.ingest.drain()
+        now = time.time()
+        for r in upd.readings:
+            dev = self.series.get(r.device)
+            if dev is None:
+                dev = self.series[r.device] = DeviceSeries(r.device, MAX_POINTS)
+            dev.add(r.ts, r.temperature, r.humidity, r.gas)
+            self.ui_latencies.append((now - r.ts) * 1000)
+        dev = self.series.get(selected)
+        if dev is not None and upd.readings:
+            t1 = dev.last_ts
+            for dec in dev.decimators:
+                dec.get(None, t1, PLOT_WIDTH)
+        self.poll_ms.append((time.perf_counter() - t0) * 1000)
+
+    def _sample(self):
+        while not self._stop.wait(SAMPLE_MS / 1000.0):
+            self.ingest_depth.append(self.ingest.q.qsize())
+            self.writer_depth.append(self.writer.q.qsize())
+            self.rss.append(rss_mb())
+
+    # ---------------- run ----------------
+    def run(self):
+        rss_start = rss_mb()
+        self.writer.start()
+        self.ingest.start()
+        send = self._send_direct
+        if self.broker:
+            send = self._connect_broker()
+
+        threads = [threading.Thread(target=self._poll, daemon=True),
+                   threading.Thread(target=self._sample, daemon=True)]
+        for t in threads:
+            t.start()
+        elapsed = self._produce(send)
+
+        # let everything in flight reach the UI and the database
+        t_drain = time.perf_counter()
+        if self.mqtt is not None:
+            while self.ingest.received < self.sent and time.perf_counter() - t_drain < 10:
+                time.sleep(0.05)
+            self.mqtt.stop(wait=True)
+            self._publisher.loop_stop()
+            self._publisher.disconnect()
+        self.ingest.stop(timeout=60)
+        self.writer.stop()
+        drain_s = time.perf_counter() - t_drain
+        self._stop.set()
+        for t in threads:
+            t.join()
+
+        ist = self.ingest.stats()
+        wst = self.writer.stats()
+        return {
+            "config": {"devices": len(self.devices), "rate": self.rate, "duration_s": self.duration,
+                       "broker": self.broker, "drop_policy": self.ingest.drop_policy,
+                       "payload": self.payload},
+            "env": {"python": platform.python_version(), "platform": platform.platform(),
+                    "time": time.strftime("%Y-%m-%d %H:%M:%S")},
+            "sent": self.sent,
+            "received": ist["received"],
+            "stored": wst["rows"],
+            "dropped": ist["dropped"],
+            "bad_payload": ist["bad_payload"],
+            "elapsed_s": elapsed,
+            "drain_s": drain_s,
+            # rows committed per second of wall time, including the final drain
+            "throughput_msg_s": wst["rows"] / (elapsed + drain_s) if elapsed else 0.0,
+            "ui_latency_ms": percentiles(self.ui_latencies),
+            "db_latency_ms": percentiles(self.writer.latencies),
+            "poll_ms": percentiles(self.poll_ms),
+            "flush_ms": {"max": wst["max_flush_ms"], "flushes": wst["flushes"]},
+            "queue": {"ingest_max": max(self.ingest_depth, default=0),
+                      "ingest_mean": float(np.mean(self.ingest_depth)) if self.ingest_depth else 0.0,
+                      "writer_max": max(self.writer_depth, default=0)},
+            "rss_mb": {"start": rss_start, "end": rss_mb(), "peak": peak_rss_mb()},
+        }
+
+    def _connect_broker(self):
+        import paho.mqtt.client as mqtt
+        from connection import MqttConnection
+
+        host, _, port = self.broker.partition(":")
+        port = int(port or 1883)
+        topic = TOPIC_FMT.format(device="+")
+        self.mqtt = MqttConnection(host, port, topic, self._on_message,
+                                   client_id=f"iot-bench-sub-{os.getpid()}", clean_session=True)
+        self.mqtt.start()
+        deadline = time.monotonic() + 10
+        while not self.mqtt.connected:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"could not connect to {self.broker}")
+            time.sleep(0.05)
+        self._publisher = mqtt.Client(client_id=f"iot-bench-pub-{os.getpid()}")
+        self._publisher.connect(host, port)
+        self._publisher.loop_start()
+
+        def send(topic, payload):
+            self._publisher.publish(topic, payload, qos=1)
+        return send
+
+
+# ---------------- reporting ----------------
+def _get(report, key):
+    for part in key.split("."):
+        report = report.get(part) if isinstance(report, dict) else None
+    return report
+
+
+def format_report(r):
+    fmt = lambda p: " ".join(f"{k} {v:.1f}" for k, v in p.items() if v is not None) or "-"
+    c = r["config"]
+    return "\n".join([
+        f"{c['devices']} devices, rate {c['rate'] or 'max'} msg/s, {c['duration_s']} s"
+        + (f", broker {c['broker']}" if c["broker"] else "")
+        + (f", {c['payload']} payloads" if c.get("payload", "json") != "json" else ""),
+        f"  sent {r['sent']}, received {r['received']}, stored {r['stored']}, "
+        f"dropped {r['dropped']}, unparsable {r['bad_payload']}",
+        f"  throughput    {r['throughput_msg_s']:.0f} msg/s (drain {r['drain_s']:.2f} s)",
+        f"  ->UI latency  {fmt(r['ui_latency_ms'])} ms",
+        f"  ->DB latency  {fmt(r['db_latency_ms'])} ms",
+        f"  UI poll       {fmt(r['poll_ms'])} ms",
+        f"  DB flush      max {r['flush_ms']['max']:.1f} ms over {r['flush_ms']['flushes']} flushes",
+        f"  queue depth   ingest max {r['queue']['ingest_max']} (mean {r['queue']['ingest_mean']:.0f}), "
+        f"writer max {r['queue']['writer_max']}",
+        f"  RSS           {r['rss_mb']['start']:.0f} -> {r['rss_mb']['end']:.0f} MB "
+        f"(peak {r['rss_mb']['peak']:.0f} MB)",
+    ])
+
+
+def compare(report, baseline, tolerance=TOLERANCE):
+    """Lines describing each metric's change; second value is True if anything regressed."""
+    lines, regressed = [], False
+    for key, higher_better in METRICS.items():
+        new, old = _get(report, key), _get(baseline, key)
+        if new is None or old is None:
+            continue
+        change = (new - old) / old if old else 0.0
+        worse = -change if higher_better else change
+        flag = ""
+        if worse > tolerance:
+            flag = "  REGRESSION"
+            regressed = True
+        lines.append(f"  {key:<20}{old:12.1f} -> {new:12.1f}  {change:+7.1%}{flag}")
+    return lines, regressed
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark the frontend ingest/storage/plot path")
+    ap.add_argument("--rate", type=float, default=2000, help="messages/s over all devices, 0 = unthrottled")
+    ap.add_argument("--devices", type=int, default=10)
+    ap.add_argument("--duration", type=float, default=10, help="seconds of load")
+    ap.add_argument("--broker", help="host[:port] of a real broker instead of calling on_message directly")
+    ap.add_argument("--drop-policy", default="oldest", choices=("oldest", "newest", "block"))
+    ap.add_argument("--payload", default="json", choices=("json", "packed"),
+                    help="payload encoding sent (json = the firmware's format)")
+    ap.add_argument("--db", help="database to write (default: a temporary file)")
+    ap.add_argument("--out", help="save the report as JSON")
+    ap.add_argument("--compare", help="JSON report to compare against")
+    ap.add_argument("--tolerance", type=float, default=TOLERANCE)
+    ap.add_argument("--perf", action="store_true", help="also collect and report the perf.py hot-path timings")
+    args = ap.parse_args(argv)
+    perf.enabled = args.perf
+
+    with tempfile.TemporaryDirectory(prefix="iot-bench-") as tmp:
+        db = args.db or os.path.join(tmp, "bench.db")
+        report = Bench(db, args.devices, args.rate, args.duration, args.broker, args.drop_policy,
+                       args.payload).run()
+    if args.perf:
+        report["perf"] = perf.snapshot()["timings"]
+
+    print(format_report(report))
+    if args.perf:
+        print(perf.format_table())
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"saved {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        lines, regressed = compare(report, baseline, args.tolerance)
+        print(f"vs {args.compare}:")
+        if baseline.get("config") != report["config"]:
+            print(f"  note: baseline was run with {baseline.get('config')}")
+        print("\n".join(lines))
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
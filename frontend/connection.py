@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+MQTT connection manager shared by the dashboard and the headless recorder.
+ - runs the paho network loop on its own thread; nothing here blocks the caller
+ - reconnects with jittered exponential backoff (RECONNECT_MIN_S .. RECONNECT_MAX_S)
+ - persistent session (clean_session=False, fixed client id) + QoS 1 subscribe,
+   so the broker queues what is published while we are away
+ - counts connects/reconnects and accumulated downtime
+State changes and log messages are put on `events` for the owner to drain;
+callers never get paho callbacks on their own thread except on_message.
+"""
+
+import queue, random, socket, threading, time
+
+# ---------------- CONFIG ----------------
+SUBSCRIBE_QOS = 1
+KEEPALIVE_S = 60
+RECONNECT_MIN_S = 1.0
+RECONNECT_MAX_S = 60.0
+# --------------------------------------
+
+
+def default_client_id(role):
+    # stable across restarts so the broker can resume the persistent session
+    return f"iot-{role}-{socket.gethostname()}"[:64]
+
+
+def backoff_delay(attempt, lo=RECONNECT_MIN_S, hi=RECONNECT_MAX_S):
+    """Exponential backoff with "equal jitter": half fixed, half random."""
+    d = min(hi, lo * (2 ** max(attempt - 1, 0)))
+    return d / 2 + random.uniform(0, d / 2)
+
+
+class MqttConnection:
+    def __init__(self, host, port, topic, on_message, user=None, password=None,
+                 client_id=None, clean_session=False, qos=SUBSCRIBE_QOS):
+        self.host, self.port, self.topic = host, port, topic
+        self.user, self.password = user, password
+        self.client_id = client_id or default_client_id("frontend")
+        self.clean_session = clean_session
+        self.qos = qos
+        self.on_message = on_message
+
+        self.client = None
+        self.state = "stopped"   # connecting / connected / backoff / stopped
+        self.events = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+
+        # metrics
+        self.connects = 0
+        self.reconnects = 0
+        self.failed_attempts = 0
+        self.downtime_s = 0.0
+        self.down_since = None     # set while a previously working link is down
+        self.connected_since = None
+
+    # ---------------- owner API ----------------
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="mqtt", daemon=True)
+            self._thread.start()
+
+    def stop(self, wait=False):
+        self._stop.set()
+        c = self.client
+        if c is not None:
+            try:
+                c.disconnect()
+            except Exception:
+                pass
+        if wait and self._thread is not None:
+            self._thread.join(5.0)
+        self._thread = None
+
+    @property
+    def connected(self):
+        return self.state == "connected"
+
+    def publish(self, topic, payload, qos=0):
+        if self.client is None or not self.connected:
+            return False
+        self.client.publish(topic, payload, qos=qos)
+        return True
+
+    def stats(self):
+        down = self.downtime_s
+        if self.down_since is not None:
+            down += time.time() - self.down_since
+        return {
+            "state": self.state,
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+            "failed_attempts": self.failed_attempts,
+            "downtime_s": down,
+        }
+
+    # ---------------- network thread ----------------
+    def _event(self, msg):
+        self.events.put(msg)
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            self._event(f"Connect refused by {self.host}:{self.port} (rc={rc})")
+            return
+        now = time.time()
+        self.connects += 1
+        if self.down_since is not None:
+            self.reconnects += 1
+            self.downtime_s += now - self.down_since
+            self._event(f"Reconnected after {now - self.down_since:.1f} s down")
+            self.down_since = None
+        self.connected_since = now
+        self._attempt = 0
+        resumed = " (session resumed)" if flags.get("session present") else ""
+        client.subscribe(self.topic, qos=self.qos)
+        self.state = "connected"
+        self._event(f"Subscribed to {self.topic} (QoS {self.qos}){resumed}")
+
+    def _on_disconnect(self, client, userdata, rc):
+        if self.state == "connected" and self.down_since is None:
+            self.down_since = time.time()
+        self.connected_since = None
+        if not self._stop.is_set():
+            self.state = "backoff"
+            self._event(f"MQTT disconnected (rc={rc})")
+
+    def _run(self):
+        import paho.mqtt.client as mqtt
+
+        c = mqtt.Client(client_id=self.client_id, clean_session=self.clean_session)
+        if self.user:
+            c.username_pw_set(self.user, self.password)
+        c.on_connect = self._on_connect
+        c.on_disconnect = self._on_disconnect
+        c.on_message = self.on_message
+        # only records host/port; the actual connect happens in reconnect() below
+        c.connect_async(self.host, self.port, keepalive=KEEPALIVE_S)
+        self.client = c
+        self._attempt = 0
+
+        while not self._stop.is_set():
+            self.state = "connecting"
+            try:
+                c.reconnect()
+            except Exception as e:
+                self.failed_attempts += 1
+                self._attempt += 1
+                delay = backoff_delay(self._attempt)
+                self._event(f"Connect to {self.host}:{self.port} failed: {e}; retry in {delay:.1f} s")
+                self.state = "backoff"
+                self._stop.wait(delay)
+                continue
+
+            while not self._stop.is_set():
+                if c.loop(timeout=1.0) != mqtt.MQTT_ERR_SUCCESS:
+                    break
+            if self._stop.is_set():
+                break
+            # link dropped (or CONNACK refused): back off before the next attempt
+            self._attempt += 1
+            if self.state == "connected":
+                self._on_disconnect(c, None, -1)
+            delay = backoff_delay(self._attempt)
+            self.state = "backoff"
+            self._event(f"Reconnecting in {delay:.1f} s")
+            self._stop.wait(delay)
+
+        try:
+            c.disconnect()
+            c.loop(timeout=0.1)
+        except Exception:
+            pass
+        self.state = "stopped"
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Headless recorder: MQTT -> ingest pipeline -> SQLite, without tkinter or matplotlib.
+Meant to run as a service on a small box; the dashboard can then be started with
+--read-only against the same database file.
+
+    python daemon.py [--host H] [--port P] [--topic T] [--user U] [--db PATH]
+                     [--perf-dump /run/iot/perf.prom] [--alert-rules rules.json]
+                     [--raw-days 30] [--no-archive] [--api [HOST:]PORT]
+    python IOTfrontend.py --headless ...    (same thing)
+
+The MQTT password is read from $MQTT_PASS (or --password).
+"""
+
+import argparse, logging, os, signal, sys, threading, time
+
+from storage import DB_PATH, open_db, ensure_schema, SQLiteWriter
+from ingest import IngestPipeline, DEFAULT_TOPIC
+from connection import MqttConnection, default_client_id
+from perf import perf
+from retention import RetentionWorker, RAW_DAYS
+from api import ApiServer, parse_addr
+from alerts import AlertEngine, load_rules, alert_payload, describe as describe_alert, ALERT_TOPIC_FMT
+
+# ---------------- CONFIG ----------------
+STATS_S = 60    # how often throughput is logged
+API_POLL_S = 0.25   # how often new readings are handed to the API live stream
+# --------------------------------------
+
+log = logging.getLogger("iot-recorder")
+
+
+class Recorder:
+    def __init__(self, host, port, topic, user=None, password=None, db_path=DB_PATH, perf_dump=None,
+                 alert_rules=None, raw_days=RAW_DAYS, archive=True, api_addr=None):
+        self.host, self.port, self.topic = host, port, topic
+        self.user, self.password = user, password
+        self.db_path = db_path
+        self.mqtt = None
+        self._stop = threading.Event()
+
+        conn = open_db(db_path)
+        migrated = ensure_schema(conn)
+        conn.close()
+        if migrated:
+            log.info("migrated %s to the indexed readings table", ", ".join(migrated))
+
+        self.writer = SQLiteWriter(db_path)
+        self._rows_seen = (time.monotonic(), 0)   # for the rows/s in the stats line
+        self.alerts = AlertEngine(alert_rules)
+        # the UI outbox is only filled when the API drains it
+        self.api = ApiServer(*api_addr, db_path=db_path, raw_days=raw_days) if api_addr else None
+        self.ingest = IngestPipeline(self.writer, publish_ui=self.api is not None,
+                                     alerts=self.alerts, on_alert=self._on_alert)
+        self.perf_dump = perf_dump
+        self.retention = RetentionWorker(db_path, raw_days=raw_days, archive=archive)
+
+    # ---------------- alerts (ingest thread) ----------------
+    def _on_alert(self, a):
+        log.warning(describe_alert(a))
+        if self.mqtt is not None:
+            self.mqtt.publish(ALERT_TOPIC_FMT.format(device=a.device), alert_payload(a), qos=1)
+
+    # ---------------- MQTT (network thread) ----------------
+    def _on_message(self, client, userdata, msg):
+        if perf.enabled:
+            t0 = time.perf_counter()
+            self.ingest.submit(time.time(), msg.topic, msg.payload)
+            perf.observe("mqtt.on_message", time.perf_counter() - t0)
+        else:
+            self.ingest.submit(time.time(), msg.topic, msg.payload)
+
+    # ---------------- run ----------------
+    def run(self):
+        self.writer.start()
+        self.ingest.start()
+        self.retention.start()
+        if self.api is not None:
+            self.api.start()
+
+        # persistent session under a stable client id: the broker keeps QoS 1
+        # messages for us while we are disconnected or restarting
+        self.mqtt = MqttConnection(self.host, self.port, self.topic, self._on_message,
+                                   user=self.user, password=self.password,
+                                   client_id=default_client_id("recorder"))
+        self.mqtt.start()
+        if self.perf_dump:
+            perf.enabled = True
+            perf.add_source("ingest", self.ingest.stats)
+            perf.add_source("db", self.writer.stats)
+            perf.add_source("mqtt", self.mqtt.stats)
+            perf.add_source("alerts", self.alerts.stats)
+            if self.api is not None:
+                perf.add_source("api", self.api.stats)
+            perf.start_dump(self.perf_dump)
+
+        stats_at = time.monotonic() + STATS_S
+        events_at = 0.0
+        try:
+            while not self._stop.wait(API_POLL_S if self.api is not None else 1.0):
+                if self.api is not None:
+                    upd = self.ingest.drain()
+                    self.api.publish(upd.readings, upd.alerts)
+                if time.monotonic() >= events_at:
+                    events_at = time.monotonic() + 1.0
+                    self._log_events()
+                if time.monotonic() >= stats_at:
+                    stats_at = time.monotonic() + STATS_S
+                    self._log_stats()
+        finally:
+            self.mqtt.stop(wait=True)
+            try:
+                if self.api is not None:
+                    self.api.stop()
+            except Exception as e:
+                log.error("API shutdown failed: %s", e)
+            self.retention.stop()
+            self._log_events()
+            self.ingest.stop()
+            self.writer.stop()
+            perf.stop_dump()
+            self._log_stats()
+            log.info("stopped")
+
+    def stop(self, *args):
+        self._stop.set()
+
+    def _log_events(self):
+        while not self.mqtt.events.empty():
+            log.info(self.mqtt.events.get())
+        while not self.writer.errors.empty():
+            log.error(self.writer.errors.get())
+        while not self.writer.notices.empty():
+            log.warning(self.writer.notices.get())
+        while not self.retention.errors.empty():
+            log.error(self.retention.errors.get())
+        while self.api is not None and not self.api.errors.empty():
+            log.error(self.api.errors.get())
+        while not self.retention.notices.empty():
+            log.info(self.retention.notices.get())
+
+    def _log_stats(self):
+        self._log_events()
+        st = self.writer.stats()
+        ist = self.ingest.stats()
+        mst = self.mqtt.stats()
+        now = time.monotonic()
+        t_prev, rows_prev = self._rows_seen
+        self._rows_seen = (now, st["rows"])
+        log.info("%d received, %d dropped, %d unparsable | db %.1f rows/s, flush %.1f ms (max %.1f), %d pending"
+                 " | mqtt %s, %d reconnects, %.0f s down",
+                 ist["received"], ist["dropped"], ist["bad_payload"],
+                 (st["rows"] - rows_prev) / (now - t_prev), st["last_flush_ms"], st["max_flush_ms"], st["pending"],
+                 mst["state"], mst["reconnects"], mst["downtime_s"])
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Headless air sensor recorder")
+    ap.add_argument("--headless", action="store_true", help=argparse.SUPPRESS)
+    ap.add_argument("--host", default=os.environ.get("MQTT_HOST", "localhost"))
+    ap.add_argument("--port", type=int, default=int(os.environ.get("MQTT_PORT", 1883)))
+    ap.add_argument("--topic", default=os.environ.get("MQTT_TOPIC", DEFAULT_TOPIC))
+    ap.add_argument("--user", default=os.environ.get("MQTT_USER"))
+    ap.add_argument("--password", default=os.environ.get("MQTT_PASS"))
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--perf-dump", metavar="PATH",
+                    help="time the hot paths and write them to PATH every few seconds "
+                         "(.prom/.txt = Prometheus text, otherwise JSON)")
+    ap.add_argument("--raw-days", type=int, default=RAW_DAYS,
+                    help="keep raw readings this many days (rollups are kept longer)")
+    ap.add_argument("--no-archive", action="store_true",
+                    help="delete expired raw readings without archiving them")
+    ap.add_argument("--alert-rules", metavar="JSON",
+                    help="alert rules file (default: the rules in alerts.py)")
+    ap.add_argument("--api", metavar="[HOST:]PORT",
+                    help="serve a read-only HTTP/WebSocket API (see api.py), e.g. --api 8080")
+    args = ap.parse_args(argv)
+    try:
+        api_addr = parse_addr(args.api) if args.api else None
+    except ValueError:
+        ap.error("--api: expected [HOST:]PORT")
+    try:
+        rules = load_rules(args.alert_rules)
+    except (OSError, ValueError) as e:
+        ap.error(f"--alert-rules: {e}")
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr,
+                        format="%(asctime)s %(levelname)s %(message)s")
+
+    rec = Recorder(args.host, args.port, args.topic, args.user, args.password, args.db, args.perf_dump,
+                   rules, args.raw_days, not args.no_archive, api_addr)
+    signal.signal(signal.SIGTERM, rec.stop)
+    signal.signal(signal.SIGINT, rec.stop)
+    rec.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Payload decoders for the ingest thread. A message is routed on its first byte:
+
+    {        json_fast   the firmware's fixed {"temperature":..,"humidity":..,"gas_raw":..},
+                         matched with one regex; anything else falls back to
+             json        generic JSON object
+    [        json        array of sample objects (buffered readings in one publish)
+    0x01     packed      compact binary, see below
+    0x80-BF  cbor        CBOR map or array of maps (needs `pip install cbor2`)
+
+JSON with leading whitespace (space, tab, CR, LF) is routed to json as well.
+
+Every decoder returns a list of samples (ts, temperature, humidity, gas) and
+raises ValueError on a payload it can't read. A sample in a batch may carry
+"ts" (epoch seconds) or "age" (seconds before the message was received);
+otherwise it gets the receive time. Missing or non-numeric values are None,
+so a failed DHT read ("nan" from the firmware) still keeps the gas value.
+
+Packed format, little endian:
+    0x01, count (uint8), then count x (age s uint16, temperature 0.1 °C int16,
+    humidity 0.1 % int16, gas uint16); -32768 / 65535 = missing.
+
+Other formats can be added with PayloadDecoder.register(name, fn, first_bytes).
+"""
+
+import json, math, re, struct
+
+# ---------------- CONFIG ----------------
+MAX_SAMPLES = 1000       # per message; longer batches are rejected
+# --------------------------------------
+
+PACKED_MAGIC = 0x01
+_PACKED_HEAD = struct.Struct("<BB")
+_PACKED_SAMPLE = struct.Struct("<HhhH")
+_I16_MISSING = -32768
+_U16_MISSING = 0xFFFF
+
+# exactly what src/main.cpp builds with String(t, 1) etc.; values may be nan
+_FIRMWARE_JSON = re.compile(rb'\{"temperature":([^,]*),"humidity":([^,]*),"gas_raw":([^,}]*)\}')
+
+
+def _num(v):
+    # bool is an int subclass but never a valid reading; NaN/inf are "no reading"
+    if isinstance(v, (int, float)) and not isinstance(v, bool) and math.isfinite(v):
+        return v
+    return None
+
+
+def _token(b):
+    try:
+        v = float(b)
+    except ValueError:
+        return None
+    return v if math.isfinite(v) else None
+
+
+def _sample(obj, ts):
+    if not isinstance(obj, dict):
+        raise ValueError("sample is not an object")
+    t = _num(obj.get("ts"))
+    if t is None:
+        age = _num(obj.get("age"))
+        t = ts - age if age is not None else ts
+    return t, _num(obj.get("temperature")), _num(obj.get("humidity")), _num(obj.get("gas_raw"))
+
+
+def _samples(obj, ts):
+    if isinstance(obj, dict):
+        return [_sample(obj, ts)]
+    if isinstance(obj, list):
+        if len(obj) > MAX_SAMPLES:
+            raise ValueError(f"more than {MAX_SAMPLES} samples")
+        return [_sample(o, ts) for o in obj]
+    raise ValueError("not an object or array")
+
+
+# ---------------- decoders: fn(raw bytes, receive ts) -> [(ts, t, h, g)] ----------------
+def decode_json(raw, ts):
+    try:
+        obj = json.loads(raw)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(str(e))
+    return _samples(obj, ts)
+
+
+def decode_packed(raw, ts):
+    magic, n = _PACKED_HEAD.unpack_from(raw)
+    if magic != PACKED_MAGIC or len(raw) != _PACKED_HEAD.size + n * _PACKED_SAMPLE.size:
+        raise ValueError("bad packed header or length")
+    out = []
+    for age, t, h, g in _PACKED_SAMPLE.iter_unpack(raw[_PACKED_HEAD.size:]):
+        out.append((ts - age,
+                    None if t == _I16_MISSING else t / 10.0,
+                    None if h == _I16_MISSING else h / 10.0,
+                    None if g == _U16_MISSING else g))
+    return out
+
+
+def encode_packed(samples, now):
+    """Inverse of decode_packed, for tests and simulators: samples are (ts, t, h, g)."""
+    out = [_PACKED_HEAD.pack(PACKED_MAGIC, len(samples))]
+    for ts, t, h, g in samples:
+        out.append(_PACKED_SAMPLE.pack(
+            max(0, min(int(round(now - ts)), 0xFFFF)),
+            _I16_MISSING if t is None else int(round(t * 10)),
+            _I16_MISSING if h is None else int(round(h * 10)),
+            _U16_MISSING if g is None else int(g)))
+    return b"".join(out)
+
+
+def decode_cbor(raw, ts):
+    try:
+        import cbor2
+    except ImportError:
+        raise ValueError("CBOR payloads need cbor2 (pip install cbor2)")
+    try:
+        obj = cbor2.loads(raw)
+    except Exception as e:
+        raise ValueError(str(e))
+    return _samples(obj, ts)
+
+
+class PayloadDecoder:
+    """Routes payloads to decoders by first byte and counts per decoder. Ingest thread only."""
+
+    def __init__(self):
+        self._by_byte = [None] * 256
+        self.counts = {}       # name -> [messages, samples, errors]
+        # JSON may start with whitespace; none of these bytes begin a packed or CBOR payload
+        self.register("json", decode_json, b"{[ \t\r\n")
+        self.register("packed", decode_packed, bytes([PACKED_MAGIC]))
+        self.register("cbor", decode_cbor, bytes(range(0x80, 0xC0)))
+        self.counts["json_fast"] = [0, 0, 0]
+        self.counts["unknown"] = [0, 0, 0]
+
+    def register(self, name, fn, first_bytes):
+        """fn(raw, ts) -> [(ts, t, h, g)], raising ValueError on bad input."""
+        self.counts.setdefault(name, [0, 0, 0])
+        for b in first_bytes:
+            self._by_byte[b] = (name, fn)
+
+    def decode(self, raw, ts):
+        """Samples in raw (bytes or str), or None if it can't be decoded."""
+        if isinstance(raw, str):
+            raw = raw.encode("utf-8")
+        m = _FIRMWARE_JSON.fullmatch(raw)
+        if m is not None:
+            c = self.counts["json_fast"]
+            c[0] += 1
+            c[1] += 1
+            t, h, g = m.groups()
+            return [(ts, _token(t), _token(h), _token(g))]
+        route = self._by_byte[raw[0]] if raw else None
+        if route is None:
+            self.counts["unknown"][2] += 1
+            return None
+        name, fn = route
+        c = self.counts[name]
+        c[0] += 1
+        try:
+            samples = fn(raw, ts)
+        except (ValueError, struct.error):
+            c[2] += 1
+            return None
+        c[1] += len(samples)
+        return samples
+
+    def stats(self):
+        out = {}
+        for name, (msgs, samples, errors) in self.counts.items():
+            if msgs or errors:
+                out[f"{name}_msgs"] = msgs
+                out[f"{name}_samples"] = samples
+                out[f"{name}_errors"] = errors
+        return out
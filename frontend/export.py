@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Streaming export of stored readings.
+Rows are pulled from SQLite with fetchmany() in CHUNK_ROWS blocks and written
+as they arrive, so memory use does not depend on the size of the database.
+Formats (by file extension): .csv, .csv.gz, .parquet (needs pyarrow).
+
+    python export.py out.csv.gz [--db sensor_data.db] [--device esp01 ...]
+                     [--from "2026-01-01"] [--to "2026-01-08 12:00"]
+                     [--columns timestamp,device,temperature]
+"""
+
+import argparse, csv, gzip, threading, time, sys
+
+from storage import DB_PATH, open_db
+
+# ---------------- CONFIG ----------------
+CHUNK_ROWS = 5000
+# --------------------------------------
+
+# export column -> SQL expression (readings r JOIN devices d)
+COLUMNS = {
+    "timestamp": "strftime('%Y-%m-%d %H:%M:%f', r.ts_ms / 1000.0, 'unixepoch', 'localtime')",
+    "ts_ms": "r.ts_ms",
+    "device": "d.name",
+    "topic": "r.topic",
+    "temperature": "r.temperature",
+    "humidity": "r.humidity",
+    "gas_raw": "r.gas",
+    "payload": "r.payload",
+}
+DEFAULT_COLUMNS = ("timestamp", "device", "topic", "temperature", "humidity", "gas_raw", "payload")
+
+FORMATS = {
+    "CSV": ".csv",
+    "CSV (gzip)": ".csv.gz",
+    "Parquet": ".parquet",
+}
+
+_TIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d")
+
+
+def parse_time(text):
+    """Local 'YYYY-MM-DD[ HH:MM[:SS]]' -> epoch seconds; blank -> None."""
+    text = (text or "").strip()
+    if not text:
+        return None
+    for fmt in _TIME_FORMATS:
+        try:
+            return time.mktime(time.strptime(text, fmt))
+        except ValueError:
+            pass
+    raise ValueError(f"bad time {text!r}, expected YYYY-MM-DD[ HH:MM[:SS]]")
+
+
+def _query(columns, devices, t_from, t_to, max_id=None):
+    where, args = [], []
+    if devices:
+        where.append(f"d.name IN ({', '.join('?' * len(devices))})")
+        args += list(devices)
+    if t_from is not None:
+        where.append("r.ts_ms >= ?")
+        args.append(int(t_from * 1000))
+    if t_to is not None:
+        where.append("r.ts_ms < ?")
+        args.append(int(t_to * 1000))
+    if max_id is not None:
+        where.append("r.id <= ?")
+        args.append(max_id)
+    sql = " FROM readings r JOIN devices d ON d.id = r.device_id"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    select = "SELECT " + ", ".join(COLUMNS[c] for c in columns) + sql
+    # (device_id, ts_ms) order walks the index instead of sorting
+    return select + " ORDER BY r.device_id, r.ts_ms", "SELECT count(*)" + sql, args
+
+
+class _CsvSink:
+    def __init__(self, path, columns):
+        if path.endswith(".gz"):
+            self.f = gzip.open(path, "wt", newline="", compresslevel=6)
+        else:
+            self.f = open(path, "w", newline="")
+        self.w = csv.writer(self.f)
+        self.w.writerow(columns)
+
+    def write(self, rows):
+        self.w.writerows(rows)
+
+    def close(self):
+        self.f.close()
+
+
+class _ParquetSink:
+    def __init__(self, path, columns):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+        types = {"ts_ms": pa.int64(), "temperature": pa.float64(),
+                 "humidity": pa.float64(), "gas_raw": pa.float64()}
+        self.pa = pa
+        self.columns = columns
+        self.schema = pa.schema([(c, types.get(c, pa.string())) for c in columns])
+        self.w = pq.ParquetWriter(path, self.schema, compression="zstd")
+
+    def write(self, rows):
+        cols = list(zip(*rows))
+        arrays = [self.pa.array(col, type=f.type) for col, f in zip(cols, self.schema)]
+        self.w.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.w.close()
+
+
+def export_readings(out_path, db_path=DB_PATH, devices=None, t_from=None, t_to=None,
+                    columns=DEFAULT_COLUMNS, chunk=CHUNK_ROWS, progress=None, cancel=None, max_id=None):
+    """
+    Stream matching readings into out_path. progress(done, total) is called after
+    every chunk; setting the `cancel` Event stops early. max_id leaves out rows
+    inserted after a known point (retention archives exactly what it deletes).
+    Returns the rows written.
+    """
+    unknown = [c for c in columns if c not in COLUMNS]
+    if unknown or not columns:
+        raise ValueError(f"unknown export columns: {unknown}")
+    select, count, args = _query(columns, devices, t_from, t_to, max_id)
+
+    conn = open_db(db_path, readonly=True)
+    try:
+        total = conn.execute(count, args).fetchone()[0]
+        if out_path.endswith(".parquet"):
+            sink = _ParquetSink(out_path, columns)
+        else:
+            sink = _CsvSink(out_path, columns)
+        done = 0
+        try:
+            cur = conn.execute(select, args)
+            while not (cancel and cancel.is_set()):
+                rows = cur.fetchmany(chunk)
+                if not rows:
+                    break
+                sink.write(rows)
+                done += len(rows)
+                if progress:
+                    progress(done, total)
+        finally:
+            sink.close()
+        return done
+    finally:
+        conn.close()
+
+
+class ExportJob:
+    """Runs export_readings() on a thread; the UI polls done/total/finished/error."""
+
+    def __init__(self, out_path, **kwargs):
+        self.out_path = out_path
+        self.kwargs = kwargs
+        self.done = 0
+        self.total = 0
+        self.rows = 0
+        self.error = None
+        self.finished = False
+        self.cancel_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="export", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def _progress(self, done, total):
+        self.done, self.total = done, total
+
+    def _run(self):
+        try:
+            self.rows = export_readings(self.out_path, progress=self._progress,
+                                        cancel=self.cancel_event, **self.kwargs)
+        except Exception as e:
+            self.error = e
+        self.finished = True
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Export stored air sensor readings.")
+    ap.add_argument("out", help="output file (.csv, .csv.gz or .parquet)")
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--device", action="append", help="repeat for several devices (default: all)")
+    ap.add_argument("--from", dest="t_from", help="local time, YYYY-MM-DD[ HH:MM[:SS]]")
+    ap.add_argument("--to", dest="t_to", help="local time, exclusive")
+    ap.add_argument("--columns", default=",".join(DEFAULT_COLUMNS),
+                    help=f"comma separated, from: {', '.join(COLUMNS)}")
+    args = ap.parse_args()
+
+    t0 = time.time()
+
+    def progress(done, total):
+        print(f"\r{done}/{total} rows", end="", file=sys.stderr)
+
+    try:
+        n = export_readings(args.out, db_path=args.db, devices=args.device,
+                            t_from=parse_time(args.t_from), t_to=parse_time(args.t_to),
+                            columns=[c.strip() for c in args.columns.split(",") if c.strip()],
+                            progress=progress)
+    except (ValueError, RuntimeError) as e:
+        ap.error(str(e))
+    print(f"\n{n} rows written to {args.out} in {time.time() - t0:.1f} s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
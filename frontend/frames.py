@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Frame scheduling for the dashboard's render step.
+FrameScheduler calls one render function on the Tk timer: every 1/MAX_FPS s
+while it reports work, backing off (x BACKOFF per idle frame) to IDLE_MS when
+it doesn't, so an idle window wakes about once a second. A frame that takes
+longer than half its interval stretches the interval instead of stacking
+frames. wake() (UI thread only) brings the next frame forward after user
+input; whatever was requested in between is rendered once.
+
+TextCache remembers what each widget shows and skips config() calls that
+would not change anything.
+"""
+
+import time
+
+# ---------------- CONFIG ----------------
+MAX_FPS = 20        # render cap while data is flowing
+IDLE_MS = 1000      # slowest frame interval when nothing happens
+BACKOFF = 1.5       # interval growth per idle frame
+# --------------------------------------
+
+
+class FrameScheduler:
+    def __init__(self, root, render, max_fps=MAX_FPS, idle_ms=IDLE_MS):
+        self.root = root
+        self.render = render          # render() -> True if the frame had anything to do
+        self.min_ms = 1000.0 / max_fps
+        self.idle_ms = idle_ms
+        self.interval_ms = self.min_ms
+        self._after = None
+        self._last = 0.0
+        self.frames = 0
+        self.idle_frames = 0
+        self.render_ms = 0.0
+
+    def start(self):
+        if self._after is None:
+            self._after = self.root.after(0, self._tick)
+
+    def stop(self):
+        if self._after is not None:
+            self.root.after_cancel(self._after)
+            self._after = None
+
+    def wake(self):
+        """Render soon (within one frame at MAX_FPS) instead of at the idle interval."""
+        if self._after is None or self.interval_ms <= self.min_ms:
+            return
+        self.root.after_cancel(self._after)
+        self.interval_ms = self.min_ms
+        since_ms = (time.perf_counter() - self._last) * 1000.0
+        self._after = self.root.after(max(int(self.min_ms - since_ms), 0), self._tick)
+
+    def stats(self):
+        return {"frames": self.frames, "idle_frames": self.idle_frames,
+                "interval_ms": self.interval_ms, "render_ms": self.render_ms}
+
+    def _tick(self):
+        self._after = None
+        t0 = self._last = time.perf_counter()
+        busy = False
+        try:
+            busy = self.render()
+        finally:
+            # reschedule even if render() raised, or the dashboard stops updating
+            ms = (time.perf_counter() - t0) * 1000.0
+            self.render_ms = ms
+            self.frames += 1
+            if busy:
+                self.interval_ms = max(self.min_ms, ms * 2)
+            else:
+                self.idle_frames += 1
+                self.interval_ms = min(self.interval_ms * BACKOFF, self.idle_ms)
+            self._after = self.root.after(int(self.interval_ms), self._tick)
+
+
+class TextCache:
+    def __init__(self):
+        self._shown = {}    # widget path -> options last applied
+
+    def set(self, widget, text, **opts):
+        """widget.config(text=text, **opts) unless that is already what it shows."""
+        opts["text"] = text
+        key = str(widget)
+        if self._shown.get(key) == opts:
+            return False
+        widget.config(**opts)
+        self._shown[key] = opts
+        return True
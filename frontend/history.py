@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Lazy loading of stored history for the pan/zoom plot mode.
+The visible range is cut into fixed tiles per zoom level:
+    level 0  raw readings       6 h tiles   (views up to ~1 raw sample per pixel)
+    level 1  rollup_1m          1 d tiles
+    level 2  rollup_1h         64 d tiles
+    level 3  rollup_1d       1024 d tiles
+Tiles are fetched on a background thread from a read-only connection and kept
+in an LRU (TileCache) keyed by (device, channel, level, tile index), so panning
+back over already visited ranges doesn't touch SQLite again. Rollup tiles are
+returned as a min/max envelope, which is what the raw line looks like at that
+scale.
+"""
+
+import queue, threading, time
+from collections import OrderedDict
+
+import numpy as np
+
+from storage import open_db, ROLLUP_LEVELS
+from retention import RAW_DAYS
+
+# ---------------- CONFIG ----------------
+TILE_CACHE_MAX = 512     # tiles kept (each is at most a few thousand points)
+LIVE_TILE_TTL_S = 30     # tiles overlapping "now" are refetched after this long
+PREFETCH_TILES = 1       # neighbours fetched on either side of the view
+# --------------------------------------
+
+# level -> (source table or None for raw readings, bucket seconds, tile seconds)
+LEVELS = [(None, 0, 6 * 3600)] + [
+    (name, width, width * n) for (name, width), n in zip(ROLLUP_LEVELS, (1440, 1536, 1024))
+]
+
+# channel -> (readings column, rollup column prefix)
+CHANNELS = {
+    "temperature": ("temperature", "t"),
+    "humidity": ("humidity", "h"),
+    "gas": ("gas", "g"),
+}
+
+_EMPTY = (np.empty(0), np.empty(0))
+
+
+def choose_level(t0, t1, width_px, raw_days=RAW_DAYS):
+    """
+    Coarsest level whose buckets are still below one pixel of the view. Views
+    ending more than raw_days ago use rollup_1m: retention has archived the
+    raw rows (None = raw rows are kept forever).
+    """
+    per_px = (t1 - t0) / max(width_px, 1)
+    level = 0
+    for i, (_, bucket_s, _) in enumerate(LEVELS[1:], 1):
+        if bucket_s <= per_px:
+            level = i
+    if level == 0 and raw_days is not None and t1 < time.time() - raw_days * 86400:
+        level = 1
+    return level
+
+
+def tiles_for(level, t0, t1, prefetch=0):
+    span = LEVELS[level][2]
+    first, last = int(t0 // span) - prefetch, int(t1 // span) + prefetch
+    return range(first, last + 1)
+
+
+def fetch_tile(conn, device, channel, level, tile):
+    """(timestamps, values) of one tile, oldest first, as float64 arrays."""
+    table, bucket_s, span = LEVELS[level]
+    col, prefix = CHANNELS[channel]
+    lo, hi = tile * span, (tile + 1) * span
+    if table is None:
+        rows = conn.execute(
+            f"SELECT r.ts_ms / 1000.0, r.{col} FROM readings r JOIN devices d ON d.id = r.device_id "
+            f"WHERE d.name = ? AND r.ts_ms >= ? AND r.ts_ms < ? AND r.{col} IS NOT NULL "
+            f"ORDER BY r.ts_ms", (device, int(lo * 1000), int(hi * 1000))).fetchall()
+        if not rows:
+            return _EMPTY
+        a = np.array(rows, dtype=np.float64)
+        return a[:, 0], a[:, 1]
+    rows = conn.execute(
+        f"SELECT bucket, {prefix}_min, {prefix}_max FROM {table} "
+        f"WHERE device = ? AND bucket >= ? AND bucket < ? AND {prefix}_n > 0 ORDER BY bucket",
+        (device, int(lo), int(hi))).fetchall()
+    if not rows:
+        return _EMPTY
+    a = np.array(rows, dtype=np.float64)
+    # min at the start of the bucket, max half way: draws as the envelope
+    ts = np.column_stack((a[:, 0], a[:, 0] + bucket_s / 2)).ravel()
+    vals = a[:, 1:3].ravel()
+    return ts, vals
+
+
+class TileCache:
+    """LRU of fetched tiles; only used from the UI thread."""
+
+    def __init__(self, max_tiles=TILE_CACHE_MAX):
+        self.max_tiles = max_tiles
+        self._tiles = OrderedDict()    # key -> (ts, vals, fetched_at)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        item = self._tiles.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        self._tiles.move_to_end(key)
+        self.hits += 1
+        return item
+
+    def put(self, key, ts, vals):
+        self._tiles[key] = (ts, vals, time.time())
+        self._tiles.move_to_end(key)
+        while len(self._tiles) > self.max_tiles:
+            self._tiles.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._tiles.clear()
+
+    def __len__(self):
+        return len(self._tiles)
+
+
+class HistoryLoader:
+    """
+    Owns the cache and a fetch thread. The UI calls view() for each redraw: it
+    returns whatever is cached for the range and queues the missing tiles;
+    poll() moves finished tiles into the cache and returns True if any arrived.
+    """
+
+    def __init__(self, path, max_tiles=TILE_CACHE_MAX, raw_days=RAW_DAYS):
+        self.path = path
+        self.raw_days = raw_days
+        self.cache = TileCache(max_tiles)
+        self.errors = queue.Queue()
+        self._wanted = set()       # keys of the current view; older requests are skipped
+        self._pending = set()      # queued, being fetched, or fetched but not yet in the cache
+        self._requests = queue.LifoQueue()   # newest view first
+        self._results = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.fetched = 0
+        self.fetch_ms = 0.0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="history", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._requests.put(None)
+            self._thread.join(2.0)
+            self._thread = None
+
+    def clear(self):
+        self.cache.clear()
+
+    def pending(self):
+        return len(self._pending)
+
+    def stats(self):
+        c = self.cache
+        return {"tiles": len(c), "hits": c.hits, "misses": c.misses, "evictions": c.evictions,
+                "fetched": self.fetched, "fetch_ms": self.fetch_ms, "pending": len(self._pending)}
+
+    # ---------------- UI thread ----------------
+    def view(self, device, channels, t0, t1, width_px):
+        """
+        {channel: (timestamps, values)} for [t0, t1] from cached tiles. Missing
+        tiles are requested; requests left over from earlier views are dropped.
+        """
+        level = choose_level(t0, t1, width_px, self.raw_days)
+        span = LEVELS[level][2]
+        now = time.time()
+        visible = tiles_for(level, t0, t1)
+        todo_visible, todo_prefetch = [], []
+        out = {}
+        for channel in channels:
+            parts = []
+            for tile in tiles_for(level, t0, t1, PREFETCH_TILES):
+                key = (device, channel, level, tile)
+                item = self.cache.get(key)
+                # the tile covering "now" keeps growing; refresh it now and then
+                stale = (item is not None and (tile + 1) * span > item[2]
+                         and now - item[2] > LIVE_TILE_TTL_S)
+                if item is None or stale:
+                    (todo_visible if tile in visible else todo_prefetch).append(key)
+                if item is not None and tile in visible:
+                    parts.append(item)
+            if parts:
+                ts = np.concatenate([p[0] for p in parts])
+                vals = np.concatenate([p[1] for p in parts])
+                # whole tiles are cached; hand back just the view plus one point each side
+                i = max(np.searchsorted(ts, t0) - 1, 0)
+                j = np.searchsorted(ts, t1) + 1
+                out[channel] = (ts[i:j], vals[i:j])
+            else:
+                out[channel] = _EMPTY
+        # LIFO queue: put prefetch first so the visible tiles are fetched first
+        self._request(todo_prefetch + todo_visible)
+        return out
+
+    def _request(self, keys):
+        with self._lock:
+            self._wanted = set(keys)
+            new = [k for k in keys if k not in self._pending]
+            self._pending.update(new)
+        for key in new:
+            self._requests.put(key)
+
+    def poll(self):
+        arrived = False
+        while True:
+            try:
+                key, ts, vals = self._results.get_nowait()
+            except queue.Empty:
+                return arrived
+            self.cache.put(key, ts, vals)
+            with self._lock:
+                self._pending.discard(key)
+            arrived = True
+
+    # ---------------- fetch thread ----------------
+    def _run(self):
+        conn = None
+        while True:
+            key = self._requests.get()
+            if key is None:
+                break
+            with self._lock:
+                if key not in self._wanted:
+                    self._pending.discard(key)
+                    continue
+            try:
+                if conn is None:
+                    conn = open_db(self.path, readonly=True)
+                t0 = time.perf_counter()
+                ts, vals = fetch_tile(conn, *key)
+                self.fetch_ms = (time.perf_counter() - t0) * 1000
+                self.fetched += 1
+                # stays pending until poll() has moved it into the cache
+                self._results.put((key, ts, vals))
+                with self._lock:
+                    self._wanted.discard(key)
+            except Exception as e:
+                self.errors.put(f"History fetch error: {e}")
+                with self._lock:
+                    self._pending.discard(key)
+                    self._wanted.discard(key)
+        if conn is not None:
+            conn.close()
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+MQTT ingest pipeline for the air sensor frontend.
+    MQTT thread -> bounded queue -> ingest thread (decode, normalize, alerts)
+    -> SQLiteWriter (persist) + UI outbox (coalesced, drained once per poll)
+The Tk thread never touches raw payloads; it only picks up decoded readings.
+Nothing here imports tkinter, so the headless recorder (daemon.py) reuses it.
+DbTail feeds the same UI outbox from the database instead of MQTT, for a GUI
+attached read-only to a database another process records into.
+Payload formats (firmware JSON, batches, packed binary, CBOR) are in decoders.py.
+"""
+
+import threading, queue, time
+from collections import deque, namedtuple
+
+from storage import open_db
+from perf import perf
+from decoders import PayloadDecoder
+
+# ---------------- CONFIG ----------------
+DEFAULT_TOPIC = "home/air/+/data"   # '+' = device id, see DEVICE_TOPIC_LEVEL
+INGEST_QUEUE_MAX = 10000    # raw messages waiting for the ingest thread
+DROP_POLICY = "oldest"      # "oldest", "newest" or "block" when the queue is full
+UI_LOG_MAX = 200            # raw payload lines kept for the UI between polls
+DEVICE_TOPIC_LEVEL = 2      # home/air/<device>/data
+DEFAULT_DEVICE = "esp01"    # used when a topic is too short to carry a device id
+TAIL_MS = 500               # DbTail poll interval
+# --------------------------------------
+
+Reading = namedtuple("Reading", "ts device topic temperature humidity gas payload")
+
+# what the UI picks up each poll
+Update = namedtuple("Update", "readings logs logs_skipped alerts")
+
+_STOP = object()
+
+
+def device_from_topic(topic, level=DEVICE_TOPIC_LEVEL, default=DEFAULT_DEVICE):
+    parts = topic.split("/")
+    if level < len(parts) and parts[level]:
+        return parts[level]
+    return default
+
+
+def payload_text(raw):
+    """Payload as shown in the log and stored with STORE_PAYLOAD; binary as hex."""
+    if not isinstance(raw, (bytes, bytearray)):
+        return str(raw)
+    if raw and (raw[0] < 0x20 or raw[0] >= 0x80):
+        return "0x" + raw.hex()
+    return raw.decode("utf-8", errors="replace")
+
+
+class IngestPipeline:
+    def __init__(self, writer=None, maxsize=INGEST_QUEUE_MAX, drop_policy=DROP_POLICY,
+                 ui_log_max=UI_LOG_MAX, publish_ui=True, alerts=None, on_alert=None):
+        if drop_policy not in ("oldest", "newest", "block"):
+            raise ValueError(f"unknown drop policy: {drop_policy}")
+        self.writer = writer
+        # alerts.AlertEngine; state changes are stored, handed to on_alert(alert)
+        # (called on the ingest thread, e.g. to publish) and put in the UI outbox
+        self.alerts = alerts
+        self.on_alert = on_alert
+        # headless: nobody drains the outbox, so don't fill it
+        self.publish_ui = publish_ui
+        self.drop_policy = drop_policy
+        # topic -> device; topics repeat forever so resolve each one once
+        self._topics = {}
+        self.q = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self.decoder = PayloadDecoder()
+
+        # UI outbox, swapped out under the lock by drain()
+        self._lock = threading.Lock()
+        self._readings = []
+        self._logs = deque(maxlen=ui_log_max)
+        self._logs_skipped = 0
+        self._alerts = []
+
+        # counters
+        self.received = 0
+        self.dropped = 0
+        self.parsed = 0         # messages decoded
+        self.samples = 0        # readings they contained (batched payloads carry several)
+        self.bad_payload = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ingest", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        if self._thread is None:
+            return
+        # make room for the sentinel even if the queue is saturated
+        while True:
+            try:
+                self.q.put(_STOP, timeout=0.1)
+                break
+            except queue.Full:
+                try:
+                    self.q.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+        self._thread.join(timeout)
+        self._thread = None
+
+    # ---------------- producer side (MQTT thread) ----------------
+    def submit(self, ts, topic, payload):
+        self.received += 1
+        item = (ts, topic, payload)
+        if self.drop_policy == "block":
+            # backpressure: stall the MQTT network loop until there is room
+            self.q.put(item)
+            return
+        try:
+            self.q.put_nowait(item)
+            return
+        except queue.Full:
+            pass
+        self.dropped += 1
+        if self.drop_policy == "oldest":
+            try:
+                self.q.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self.q.put_nowait(item)
+            except queue.Full:
+                pass
+
+    def publish(self, readings):
+        """Hand already decoded readings (e.g. from DbTail) straight to the UI outbox."""
+        if readings and self.publish_ui:
+            with self._lock:
+                self._readings.extend(readings)
+
+    # ---------------- consumer side (UI thread) ----------------
+    def drain(self):
+        with self._lock:
+            readings, self._readings = self._readings, []
+            logs = list(self._logs)
+            self._logs.clear()
+            skipped, self._logs_skipped = self._logs_skipped, 0
+            alerts, self._alerts = self._alerts, []
+        return Update(readings, logs, skipped, alerts)
+
+    def stats(self):
+        return {
+            "received": self.received,
+            "parsed": self.parsed,
+            "bad_payload": self.bad_payload,
+            "dropped": self.dropped,
+            "queued": self.q.qsize(),
+            "samples": self.samples,
+            **self.decoder.stats(),
+        }
+
+    def _route(self, topic):
+        device = self._topics.get(topic)
+        if device is None:
+            device = self._topics[topic] = device_from_topic(topic)
+        return device
+
+    # ---------------- ingest thread ----------------
+    def _run(self):
+        while True:
+            item = self.q.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            # pull everything already waiting so the UI lock is taken once per burst
+            while len(batch) < 1000:
+                try:
+                    item = self.q.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._process(batch)
+                    return
+                batch.append(item)
+            self._process(batch)
+
+    def _process(self, batch):
+        readings = []
+        logs = []
+        alerts = []
+        engine = self.alerts
+        timed = perf.enabled
+        if timed:
+            # receive -> picked up by this thread
+            now = time.time()
+            for ts, _, _ in batch:
+                perf.observe("ingest.queue_wait", now - ts)
+            t_decode = 0.0
+        decode = self.decoder.decode
+        writer = self.writer
+        # the text form is only needed for the UI log and for stored payloads
+        want_text = self.publish_ui or (writer is not None and writer.store_payload)
+        payload = None
+        for ts, topic, raw in batch:
+            if want_text:
+                payload = payload_text(raw)
+                logs.append((ts, topic, payload))
+
+            if timed:
+                t0 = time.perf_counter()
+                samples = decode(raw, ts)
+                t_decode += time.perf_counter() - t0
+            else:
+                samples = decode(raw, ts)
+            if samples is None:
+                # counted per decoder; nothing to plot or store
+                self.bad_payload += 1
+                continue
+            self.parsed += 1
+            self.samples += len(samples)
+            device = self._route(topic)
+            for sts, t, h, g in samples:
+                r = Reading(sts, device, topic, t, h, g, payload)
+                readings.append(r)
+                if writer is not None:
+                    writer.submit(device, sts, (topic, t, h, g, payload))
+                if engine is not None:
+                    evs = engine.process(r)
+                    if evs:
+                        alerts.extend(evs)
+        if timed:
+            # one histogram update per batch, weighted by its size
+            perf.observe("ingest.decode", t_decode / len(batch), len(batch))
+
+        for a in alerts:
+            if self.writer is not None:
+                self.writer.submit_alert(a)
+            if self.on_alert is not None:
+                try:
+                    self.on_alert(a)
+                except Exception:
+                    pass
+
+        if not self.publish_ui:
+            return
+        with self._lock:
+            self._alerts.extend(alerts)
+            self._readings.extend(readings)
+            overflow = len(self._logs) + len(logs) - self._logs.maxlen
+            if overflow > 0:
+                self._logs_skipped += overflow
+            self._logs.extend(logs)
+
+
+class DbTail:
+    """Polls the readings table for rows added by another process and publishes them."""
+
+    def __init__(self, pipeline, path, interval_ms=TAIL_MS, chunk=5000):
+        self.pipeline = pipeline
+        self.path = path
+        self.interval_s = interval_ms / 1000.0
+        self.chunk = chunk
+        self.rows = 0
+        self.errors = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="db-tail", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        conn = None
+        names = {}
+        last_id = None
+        while not self._stop.is_set():
+            try:
+                if conn is None:
+                    conn = open_db(self.path, readonly=True)
+                if last_id is None:
+                    # only what is recorded from now on
+                    last_id = conn.execute("SELECT coalesce(max(id), 0) FROM readings").fetchone()[0]
+                while True:
+                    rows = conn.execute(
+                        "SELECT id, device_id, ts_ms, topic, temperature, humidity, gas, payload "
+                        "FROM readings WHERE id > ? ORDER BY id LIMIT ?",
+                        (last_id, self.chunk)).fetchall()
+                    if not rows:
+                        break
+                    if any(r[1] not in names for r in rows):
+                        names = dict(conn.execute("SELECT id, name FROM devices"))
+                    self.pipeline.publish([
+                        Reading(ts_ms / 1000.0, names.get(dev_id, str(dev_id)), topic, t, h, g, payload)
+                        for _, dev_id, ts_ms, topic, t, h, g, payload in rows
+                    ])
+                    self.rows += len(rows)
+                    last_id = rows[-1][0]
+            except Exception as e:
+                # e.g. the recorder hasn't created the file or the schema yet
+                self.errors.put(f"DB tail error: {e}")
+                self._stop.wait(5.0)
+            self._stop.wait(self.interval_s)
+        if conn is not None:
+            conn.close()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Bounded terminal/log panel for the dashboard.
+Lines go into a fixed-size ring buffer; the tk.Text only ever shows the newest
+VIEW_LINES lines that pass the level/topic filter, and is updated in batches at
+most once per FLUSH_MS. Lines that arrive faster than MAX_PER_FLUSH are kept in
+the ring but not drawn, and counted as suppressed.
+"""
+
+import tkinter as tk
+from tkinter import ttk
+import time
+from collections import deque
+
+# ---------------- CONFIG ----------------
+CAPACITY = 5000       # lines kept in memory
+VIEW_LINES = 300      # lines kept in the Text widget
+FLUSH_MS = 250
+MAX_PER_FLUSH = 50    # lines drawn per flush; the rest is counted as suppressed
+# --------------------------------------
+
+LEVELS = ("DATA", "INFO", "ALERT", "ERROR")
+# filter choice -> levels shown
+FILTERS = {
+    "All": set(LEVELS),
+    "System": {"INFO", "ALERT", "ERROR"},
+    "Alerts": {"ALERT"},
+    "Errors": {"ALERT", "ERROR"},
+    "Data": {"DATA"},
+}
+
+
+class LogPanel:
+    def __init__(self, root, parent, height=5):
+        self.root = root
+        self.lines = deque(maxlen=CAPACITY)   # (ts, level, topic, msg)
+        self._pending = []
+        self._flush_id = None
+        self.suppressed = 0
+        self._levels = FILTERS["All"]
+        self._topic_filter = ""
+
+        frm = ttk.Frame(parent)
+        frm.grid(row=0, column=0, columnspan=2, sticky="ew")
+        self.level_cb = ttk.Combobox(frm, values=list(FILTERS), state="readonly", width=8)
+        self.level_cb.set("All")
+        self.level_cb.pack(side="left")
+        self.level_cb.bind("<<ComboboxSelected>>", self._on_filter)
+        ttk.Label(frm, text="Topic").pack(side="left", padx=(6,2))
+        self.topic_e = ttk.Entry(frm, width=16)
+        self.topic_e.pack(side="left")
+        self.topic_e.bind("<KeyRelease>", self._on_filter)
+        self.suppressed_lbl = ttk.Label(frm, text="", foreground="grey")
+        self.suppressed_lbl.pack(side="right", padx=(6,0))
+
+        self.text = tk.Text(parent, height=height, state="disabled", font=("Consolas", 10))
+        self.text.grid(row=1, column=0, sticky="nsew")
+        scroll = ttk.Scrollbar(parent, orient="vertical", command=self.text.yview)
+        scroll.grid(row=1, column=1, sticky="ns")
+        self.text['yscrollcommand'] = scroll.set
+
+    def add(self, level, topic, msg, ts=None):
+        entry = (ts or time.time(), level, topic, msg)
+        self.lines.append(entry)
+        if self._match(entry):
+            self._pending.append(entry)
+            self._schedule()
+
+    def suppress(self, n):
+        """Count lines that were dropped before reaching the panel."""
+        self.suppressed += n
+        self._schedule()
+
+    # ---------------- internals ----------------
+    def _match(self, entry):
+        return entry[1] in self._levels and (not self._topic_filter or self._topic_filter in entry[2])
+
+    @staticmethod
+    def _fmt(entry):
+        ts, level, topic, msg = entry
+        return f"[{time.strftime('%H:%M:%S', time.localtime(ts))}] {topic}: {msg}\n"
+
+    def _schedule(self):
+        if self._flush_id is None:
+            self._flush_id = self.root.after(FLUSH_MS, self._flush)
+
+    def _flush(self):
+        self._flush_id = None
+        pending, self._pending = self._pending, []
+        if len(pending) > MAX_PER_FLUSH:
+            self.suppressed += len(pending) - MAX_PER_FLUSH
+            pending = pending[-MAX_PER_FLUSH:]
+        if pending:
+            self._write("".join(self._fmt(e) for e in pending), replace=False)
+        self.suppressed_lbl.config(text=f"{self.suppressed} suppressed" if self.suppressed else "")
+
+    def _write(self, text, replace):
+        # only follow the tail if the user hasn't scrolled up
+        at_bottom = self.text.yview()[1] >= 0.999
+        self.text.configure(state="normal")
+        if replace:
+            self.text.delete("1.0", "end")
+        self.text.insert("end", text)
+        # Text always ends with a newline, hence the +1
+        extra = int(self.text.index("end-1c").split(".")[0]) - VIEW_LINES - 1
+        if extra > 0:
+            self.text.delete("1.0", f"{extra + 1}.0")
+        self.text.configure(state="disabled")
+        if at_bottom or replace:
+            self.text.yview_moveto(1.0)
+
+    def _on_filter(self, e=None):
+        self._levels = FILTERS.get(self.level_cb.get(), FILTERS["All"])
+        self._topic_filter = self.topic_e.get().strip()
+        # redraw from the ring buffer, newest VIEW_LINES matches only
+        shown = deque((e for e in self.lines if self._match(e)), maxlen=VIEW_LINES)
+        self._pending = []
+        self._write("".join(self._fmt(e) for e in shown), replace=True)
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Hot-path timing for the frontend and the recorder.
+Code on the hot path checks `perf.enabled` before taking a timestamp, so when
+instrumentation is off the cost is one attribute lookup per call site:
+
+    if perf.enabled:
+        t0 = time.perf_counter()
+    ...
+    if perf.enabled:
+        perf.observe("db.insert", time.perf_counter() - t0)
+
+Every name gets a fixed-bucket histogram (count, sum, max, approximate
+percentiles). Registered stat sources (e.g. IngestPipeline.stats) are sampled
+into the same report. snapshot() returns a dict; to_prometheus() renders the
+text exposition format; start_dump() rewrites a file every DUMP_S.
+"""
+
+import bisect, json, os, threading, time
+
+# ---------------- CONFIG ----------------
+ENABLED = bool(os.environ.get("IOT_PERF"))
+DUMP_S = 10
+PROM_PREFIX = "iot_"
+# histogram bucket upper bounds, seconds
+BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 0.01,
+           0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# --------------------------------------
+
+
+class Histogram:
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # last bucket = +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, v, n=1):
+        i = bisect.bisect_left(self.bounds, v)
+        with self._lock:
+            self.counts[i] += n
+            self.count += n
+            self.sum += v * n
+            if v > self.max:
+                self.max = v
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (max for the +Inf bucket)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank and c:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    def summary(self):
+        with self._lock:
+            if not self.count:
+                return {"count": 0}
+            return {
+                "count": self.count,
+                "mean_ms": self.sum / self.count * 1000,
+                "p50_ms": self.quantile(0.5) * 1000,
+                "p99_ms": self.quantile(0.99) * 1000,
+                "max_ms": self.max * 1000,
+            }
+
+
+class Perf:
+    def __init__(self, enabled=ENABLED):
+        self.enabled = enabled
+        self.t0 = time.time()
+        self._hists = {}
+        self._sources = {}
+        self._lock = threading.Lock()
+        self._dump_stop = None
+
+    # ---------------- recording ----------------
+    def observe(self, name, seconds, n=1):
+        """Record a duration; n > 1 counts it for n items (e.g. a per-item average)."""
+        h = self._hists.get(name)
+        if h is None:
+            with self._lock:
+                h = self._hists.setdefault(name, Histogram())
+        h.observe(seconds, n)
+
+    def add_source(self, name, fn):
+        """fn() -> dict of numbers, sampled into every snapshot (e.g. writer.stats)."""
+        self._sources[name] = fn
+
+    def reset(self):
+        with self._lock:
+            self._hists = {}
+        self.t0 = time.time()
+
+    # ---------------- reporting ----------------
+    def snapshot(self):
+        stats = {}
+        for name, fn in list(self._sources.items()):
+            try:
+                stats[name] = {k: v for k, v in fn().items() if isinstance(v, (int, float))}
+            except Exception:
+                pass
+        return {
+            "time": time.time(),
+            "uptime_s": time.time() - self.t0,
+            "enabled": self.enabled,
+            "timings": {k: h.summary() for k, h in sorted(self._hists.items())},
+            "stats": stats,
+        }
+
+    def to_prometheus(self):
+        out = []
+        for name, h in sorted(self._hists.items()):
+            metric = PROM_PREFIX + name.replace(".", "_") + "_seconds"
+            out.append(f"# TYPE {metric} histogram")
+            with h._lock:
+                cum = 0
+                for bound, c in zip(h.bounds, h.counts):
+                    cum += c
+                    out.append(f'{metric}_bucket{{le="{bound:g}"}} {cum}')
+                out.append(f'{metric}_bucket{{le="+Inf"}} {h.count}')
+                out.append(f"{metric}_sum {h.sum:.9f}")
+                out.append(f"{metric}_count {h.count}")
+        for src, values in self.snapshot()["stats"].items():
+            for k, v in values.items():
+                metric = f"{PROM_PREFIX}{src}_{k}"
+                out.append(f"# TYPE {metric} gauge")
+                out.append(f"{metric} {float(v):g}")
+        return "\n".join(out) + "\n"
+
+    def format_table(self):
+        """Plain text table for the on-screen panel."""
+        snap = self.snapshot()
+        lines = [f"{'timing':<18}{'n':>9}{'mean':>9}{'p50':>9}{'p99':>9}{'max':>9}  ms"]
+        for name, s in snap["timings"].items():
+            if s["count"]:
+                lines.append(f"{name:<18}{s['count']:>9}{s['mean_ms']:>9.3f}{s['p50_ms']:>9.3f}"
+                             f"{s['p99_ms']:>9.3f}{s['max_ms']:>9.3f}")
+        for src, values in snap["stats"].items():
+            lines.append("")
+            lines.append(src + ": " + ", ".join(
+                f"{k} {v:.1f}" if isinstance(v, float) else f"{k} {v}" for k, v in values.items()))
+        return "\n".join(lines)
+
+    def dump(self, path):
+        """Write a snapshot to path (.prom/.txt = Prometheus text, else JSON), atomically."""
+        if path.endswith((".prom", ".txt")):
+            data = self.to_prometheus()
+        else:
+            data = json.dumps(self.snapshot(), indent=2)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def start_dump(self, path, interval_s=DUMP_S):
+        if self._dump_stop is not None:
+            return
+        stop = self._dump_stop = threading.Event()
+        self._dump_path = path
+
+        def run():
+            while not stop.wait(interval_s):
+                try:
+                    self.dump(path)
+                except OSError:
+                    pass
+
+        threading.Thread(target=run, name="perf-dump", daemon=True).start()
+
+    def stop_dump(self):
+        """Stop the dump thread and write a final snapshot."""
+        if self._dump_stop is None:
+            return
+        self._dump_stop.set()
+        self._dump_stop = None
+        try:
+            self.dump(self._dump_path)
+        except OSError:
+            pass
+
+
+# process-wide instance used by all modules
+perf = Perf()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Replay stored readings through the ingest path, for testing alert rules and
+load-testing the dashboard with real data.
+Rows are streamed (keyset-paged queries or a csv reader, never the whole
+table), turned back into the firmware's JSON and handed to
+IngestPipeline.submit() exactly like an MQTT message, with their original
+timestamps. --speed N plays N times faster than real time (1 = real time,
+0 = as fast as the pipeline takes them); silences longer than MAX_WAIT_S of
+replay time are skipped.
+
+Sources: a database (readings table, or v1 per-device tables such as esp01,
+read as they are without migrating), or a CSV written by export.py or the
+retention archive (.csv / .csv.gz, needs ts_ms or timestamp).
+
+    python replay.py ../sensor_data.db [--device esp01] [--from 2026-01-01] [--to ...]
+                     [--speed 60] [--db replayed.db] [--alert-rules rules.json]
+    python IOTfrontend.py --replay archive/esp01/2026-01-11.csv.gz --speed 100
+
+The command line version writes to a temporary database (or --db) and prints
+the alerts the rules raised; the dashboard's --replay mode only displays.
+"""
+
+import argparse, csv, gzip, heapq, os, queue, sys, tempfile, threading, time
+
+from storage import open_db, ensure_schema, legacy_tables, schema_version, SQLiteWriter
+from ingest import IngestPipeline
+from export import parse_time
+from alerts import AlertEngine, load_rules, describe as describe_alert
+
+# ---------------- CONFIG ----------------
+TOPIC_FMT = "home/air/{device}/data"
+CHUNK = 5000             # rows per query page
+MAX_WAIT_S = 2.0         # longest pause between two replayed messages
+QUEUE_HIGH = 0.9         # max speed: wait while the ingest queue is this full
+# --------------------------------------
+
+
+def _fmt(v, spec):
+    # the firmware prints a failed DHT read as nan
+    return "nan" if v is None else format(v, spec)
+
+
+def make_payload(t, h, g):
+    return ('{"temperature":%s,"humidity":%s,"gas_raw":%s}'
+            % (_fmt(t, ".1f"), _fmt(h, ".1f"), _fmt(g, ".0f"))).encode()
+
+
+# ---------------- sources: iterators of (ts, device, temperature, humidity, gas) ----------------
+def _paged(conn, sql, args, chunk=CHUNK):
+    """Keyset paging on (ts_ms, id): each page is a short read, no snapshot held between pages."""
+    last = (-1, -1)
+    while True:
+        rows = conn.execute(sql, (*args, *last, last[0], chunk)).fetchall()
+        if not rows:
+            return
+        for ts_ms, _, t, h, g in rows:
+            yield ts_ms / 1000.0, t, h, g
+        last = (rows[-1][0], rows[-1][1])
+
+
+def _legacy_rows(conn, table, chunk=CHUNK):
+    # v1 tables have no time index; rows were appended in time order, so page by id
+    last = 0
+    while True:
+        rows = conn.execute(
+            f"SELECT id, CAST(strftime('%s', timestamp, 'utc') AS INTEGER), temperature, humidity, gas "
+            f"FROM {table} WHERE id > ? ORDER BY id LIMIT ?", (last, chunk)).fetchall()
+        if not rows:
+            return
+        for _, ts, t, h, g in rows:
+            if ts is not None:
+                yield float(ts), t, h, g
+        last = rows[-1][0]
+
+
+def _device_rows(conn, device, t0, t1, legacy):
+    if legacy:
+        for ts, t, h, g in _legacy_rows(conn, device):
+            if (t0 is None or ts >= t0) and (t1 is None or ts < t1):
+                yield ts, device, t, h, g
+        return
+    sql = ("SELECT r.ts_ms, r.id, r.temperature, r.humidity, r.gas FROM readings r "
+           "WHERE r.device_id = (SELECT id FROM devices WHERE name = ?) "
+           "AND r.ts_ms >= ? AND r.ts_ms < ? AND ((r.ts_ms = ? AND r.id > ?) OR r.ts_ms > ?) "
+           "ORDER BY r.ts_ms, r.id LIMIT ?")
+    lo = -1 if t0 is None else int(t0 * 1000)
+    hi = 2 ** 62 if t1 is None else int(t1 * 1000)
+    for ts, t, h, g in _paged(conn, sql, (device, lo, hi)):
+        yield ts, device, t, h, g
+
+
+def db_rows(path, devices=None, t0=None, t1=None):
+    """Readings from a database in time order; several devices are merged per device index."""
+    conn = open_db(path, readonly=True)
+    try:
+        legacy = schema_version(conn) == 1
+        if legacy:
+            names = legacy_tables(conn)
+        else:
+            names = [r[0] for r in conn.execute("SELECT name FROM devices ORDER BY name")]
+        if devices:
+            missing = set(devices) - set(names)
+            if missing:
+                raise ValueError(f"no readings for {', '.join(sorted(missing))} in {path}")
+            names = [n for n in names if n in devices]
+        streams = [_device_rows(conn, name, t0, t1, legacy) for name in names]
+        yield from heapq.merge(*streams, key=lambda row: row[0])
+    finally:
+        conn.close()
+
+
+def _csv_float(v):
+    try:
+        return float(v) if v not in ("", None) else None
+    except ValueError:
+        return None
+
+
+def csv_rows(path, devices=None, t0=None, t1=None, default_device="esp01"):
+    """Readings from an export.py / archive CSV, in file order."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", newline="") as f:
+        reader = csv.DictReader(f)
+        cols = set(reader.fieldnames or ())
+        if not cols & {"ts_ms", "timestamp"}:
+            raise ValueError(f"{path}: needs a ts_ms or timestamp column")
+        gas_col = "gas_raw" if "gas_raw" in cols else "gas"
+        for row in reader:
+            if row.get("ts_ms"):
+                ts = int(row["ts_ms"]) / 1000.0
+            else:
+                # export.py writes local time with milliseconds
+                stamp = row["timestamp"]
+                ts = time.mktime(time.strptime(stamp[:19], "%Y-%m-%d %H:%M:%S")) + float("0" + stamp[19:])
+            device = row.get("device") or default_device
+            if (devices and device not in devices) or (t0 is not None and ts < t0) \
+                    or (t1 is not None and ts >= t1):
+                continue
+            yield (ts, device, _csv_float(row.get("temperature")), _csv_float(row.get("humidity")),
+                   _csv_float(row.get(gas_col)))
+
+
+def open_source(path, devices=None, t0=None, t1=None):
+    if not os.path.exists(path):
+        raise ValueError(f"{path} not found")
+    if path.endswith((".csv", ".csv.gz")):
+        return csv_rows(path, devices, t0, t1)
+    return db_rows(path, devices, t0, t1)
+
+
+class Replay:
+    """Feeds rows into an IngestPipeline at `speed` x real time, on its own thread or inline (run)."""
+
+    def __init__(self, rows, pipeline, speed=1.0, topic_fmt=TOPIC_FMT, max_wait_s=MAX_WAIT_S):
+        self.rows = rows
+        self.pipeline = pipeline
+        self.speed = speed
+        self.topic_fmt = topic_fmt
+        self.max_wait_s = max_wait_s
+        self.errors = queue.Queue()
+        self.done = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._topics = {}
+        self.sent = 0
+        self.first_ts = None
+        self.last_ts = None
+        self.wall_s = 0.0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run_safe, name="replay", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def clock(self):
+        """Replay time: the timestamp of the newest message sent (wall time before the first)."""
+        return self.last_ts if self.last_ts is not None else time.time()
+
+    def stats(self):
+        return {"sent": self.sent, "wall_s": self.wall_s,
+                "replayed_s": (self.last_ts - self.first_ts) if self.sent else 0.0,
+                "msgs_per_s": self.sent / self.wall_s if self.wall_s else 0.0}
+
+    def _run_safe(self):
+        try:
+            self.run()
+        except Exception as e:
+            self.errors.put(f"Replay error: {e}")
+            self.done.set()
+
+    def run(self):
+        submit = self.pipeline.submit
+        q = self.pipeline.q
+        high = q.maxsize * QUEUE_HIGH if q.maxsize else None
+        w0 = time.perf_counter()
+        t_ref = w_ref = None
+        for ts, device, t, h, g in self.rows:
+            if self._stop.is_set():
+                break
+            if self.speed:
+                if t_ref is None:
+                    t_ref, w_ref = ts, time.perf_counter()
+                wait = w_ref + (ts - t_ref) / self.speed - time.perf_counter()
+                if wait > self.max_wait_s:
+                    # long silence in the data: skip it
+                    w_ref -= wait - self.max_wait_s
+                    wait = self.max_wait_s
+                if wait > 0 and self._stop.wait(wait):
+                    break
+            elif high is not None:
+                # as fast as possible, but without making the pipeline drop messages
+                while q.qsize() >= high and not self._stop.is_set():
+                    time.sleep(0.001)
+            topic = self._topics.get(device)
+            if topic is None:
+                topic = self._topics[device] = self.topic_fmt.format(device=device)
+            submit(ts, topic, make_payload(t, h, g))
+            if self.first_ts is None:
+                self.first_ts = ts
+            self.last_ts = ts
+            self.sent += 1
+        self.wall_s = time.perf_counter() - w0
+        self.done.set()
+        return self.stats()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Replay stored readings through the ingest pipeline.")
+    ap.add_argument("source", help="database (.db) or CSV (.csv / .csv.gz) to replay")
+    ap.add_argument("--device", action="append", help="only this device (repeatable)")
+    ap.add_argument("--from", dest="t_from", help="local time YYYY-MM-DD[ HH:MM[:SS]]")
+    ap.add_argument("--to", dest="t_to")
+    ap.add_argument("--speed", type=float, default=0, help="x real time; 0 = as fast as possible")
+    ap.add_argument("--db", help="database to record into (default: a temporary file)")
+    ap.add_argument("--alert-rules", metavar="JSON", help="alert rules file (default: alerts.py rules)")
+    ap.add_argument("--quiet", action="store_true", help="don't print each alert")
+    args = ap.parse_args(argv)
+    try:
+        t0, t1 = parse_time(args.t_from), parse_time(args.t_to)
+        rules = load_rules(args.alert_rules)
+    except (OSError, ValueError) as e:
+        ap.error(str(e))
+    if args.db and os.path.abspath(args.db) == os.path.abspath(args.source):
+        ap.error("--db must not be the database being replayed")
+
+    with tempfile.TemporaryDirectory(prefix="iot-replay-") as tmp:
+        db = args.db or os.path.join(tmp, "replay.db")
+        conn = open_db(db)
+        ensure_schema(conn)
+        conn.close()
+        writer = SQLiteWriter(db)
+        engine = AlertEngine(rules)
+        on_alert = None if args.quiet else lambda a: print(
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(a.ts)), describe_alert(a), flush=True)
+        ingest = IngestPipeline(writer, publish_ui=False, alerts=engine, on_alert=on_alert)
+        writer.start()
+        ingest.start()
+        try:
+            st = Replay(open_source(args.source, args.device, t0, t1), ingest, args.speed).run()
+        except ValueError as e:
+            ap.error(str(e))
+        except KeyboardInterrupt:
+            st = None
+        finally:
+            ingest.stop()
+            writer.stop()
+        if st is None:
+            return 1
+        ist, ast = ingest.stats(), engine.stats()
+        print(f"replayed {st['sent']} messages ({st['replayed_s'] / 3600:.1f} h of data) in "
+              f"{st['wall_s']:.1f} s, {st['msgs_per_s']:.0f} msg/s | {ist['samples']} readings, "
+              f"{ist['bad_payload']} unparsable, {ist['dropped']} dropped | "
+              f"alerts {ast['raised']} raised, {ast['cleared']} cleared, {ast['active']} active at the end")
+        while not writer.errors.empty():
+            print(writer.errors.get(), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Retention for sensor_data.db: keeps the file (and query times) bounded.
+ - raw readings older than RAW_DAYS are archived per device and UTC day to
+   <db dir>/archive/<device>/<YYYY-MM-DD>.csv.gz, then deleted
+ - rollup tables keep their own, longer horizons (ROLLUP_DAYS; None = forever)
+ - alerts and gaps are kept for EVENT_DAYS
+ - freed pages are returned to the OS with incremental vacuum
+Everything runs in small transactions (DELETE_CHUNK rows, VACUUM_PAGES pages)
+with a pause in between, so the ingest writer is never blocked for long.
+
+    python retention.py [--db sensor_data.db] [--raw-days 30] [--no-archive] [--dry-run]
+"""
+
+import argparse, datetime, os, queue, sys, threading, time
+
+from storage import DB_PATH, open_db, ensure_schema, enable_incremental_vacuum, ROLLUP_LEVELS
+from export import export_readings
+
+# ---------------- CONFIG ----------------
+RAW_DAYS = 30
+ROLLUP_DAYS = {"rollup_1m": 365, "rollup_1h": 5 * 365, "rollup_1d": None}
+EVENT_DAYS = 365         # alerts, gaps
+ARCHIVE = True
+ARCHIVE_COLUMNS = ("ts_ms", "timestamp", "device", "topic", "temperature", "humidity", "gas_raw")
+DELETE_CHUNK = 5000      # rows per delete transaction
+VACUUM_PAGES = 256       # pages per incremental vacuum step (1 MiB at 4 KiB pages)
+STEP_PAUSE_S = 0.05      # between transactions, lets the writer in
+INTERVAL_S = 6 * 3600    # background run interval
+FIRST_RUN_S = 120        # first background run, after startup has settled
+# --------------------------------------
+
+DAY_MS = 86400 * 1000
+
+
+def archive_dir_for(db_path):
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), "archive")
+
+
+def _day(ms):
+    return datetime.datetime.fromtimestamp(ms / 1000, datetime.timezone.utc).strftime("%Y-%m-%d")
+
+
+def _unique(path):
+    # a day archived twice (late rows) gets a -1, -2... file next to the first
+    base, ext = path[:-len(".csv.gz")], ".csv.gz"
+    n = 0
+    while os.path.exists(path):
+        n += 1
+        path = f"{base}-{n}{ext}"
+    return path
+
+
+class Retention:
+    """One pass of the policy; run() is safe to call while the writer is active."""
+
+    def __init__(self, db_path=DB_PATH, raw_days=RAW_DAYS, rollup_days=ROLLUP_DAYS,
+                 event_days=EVENT_DAYS, archive_dir=None, archive=ARCHIVE, dry_run=False,
+                 stop_event=None, log=None):
+        self.db_path = db_path
+        self.raw_days = raw_days
+        self.rollup_days = rollup_days
+        self.event_days = event_days
+        self.archive = archive
+        self.archive_dir = archive_dir or archive_dir_for(db_path)
+        self.dry_run = dry_run
+        self.stop_event = stop_event or threading.Event()
+        self.log = log or (lambda msg: None)
+        self.stats = {}
+
+    def _pause(self):
+        return self.stop_event.wait(STEP_PAUSE_S)
+
+    def _delete_chunks(self, conn, sql, args):
+        """Repeat a DELETE ... LIMIT-style statement until it deletes nothing."""
+        total = 0
+        while not self.stop_event.is_set():
+            with conn:
+                n = conn.execute(sql, args).rowcount
+            total += n
+            if n < DELETE_CHUNK:
+                break
+            self._pause()
+        return total
+
+    def run(self):
+        t0 = time.monotonic()
+        st = self.stats = {"archived_rows": 0, "archive_files": 0, "deleted_rows": 0,
+                           "deleted_rollups": 0, "deleted_events": 0, "vacuumed_pages": 0,
+                           "vacuum_converted": 0, "size_before": os.path.getsize(self.db_path),
+                           "size_after": 0}
+        conn = open_db(self.db_path)
+        try:
+            devices = conn.execute("SELECT id, name FROM devices").fetchall()
+            now_ms = int(time.time() * 1000)
+            if self.raw_days is not None:
+                # whole UTC days only, so every archive file covers a complete day
+                cutoff = (now_ms - self.raw_days * DAY_MS) // DAY_MS * DAY_MS
+                for dev_id, name in devices:
+                    self._prune_raw(conn, dev_id, name, cutoff)
+            for table, width in ROLLUP_LEVELS:
+                days = self.rollup_days.get(table)
+                if days is not None:
+                    cutoff_s = (now_ms - days * DAY_MS) // 1000
+                    for _, name in devices:
+                        self._prune_rollup(conn, table, width, name, cutoff_s)
+            if self.event_days is not None:
+                self._prune_events(conn, devices, now_ms - self.event_days * DAY_MS)
+            if not self.dry_run:
+                self._vacuum(conn)
+        finally:
+            conn.close()
+        st["size_after"] = os.path.getsize(self.db_path)
+        st["seconds"] = time.monotonic() - t0
+        return st
+
+    # ---------------- raw readings ----------------
+    def _prune_raw(self, conn, dev_id, name, cutoff):
+        st = self.stats
+        day = conn.execute("SELECT min(ts_ms) FROM readings WHERE device_id = ? AND ts_ms < ?",
+                           (dev_id, cutoff)).fetchone()[0]
+        while day is not None and not self.stop_event.is_set():
+            lo = day // DAY_MS * DAY_MS
+            hi = lo + DAY_MS
+            # rows arriving for this day after the archive was written are left for the next pass
+            n, max_id = conn.execute("SELECT count(*), max(id) FROM readings "
+                                     "WHERE device_id = ? AND ts_ms >= ? AND ts_ms < ?",
+                                     (dev_id, lo, hi)).fetchone()
+            if self.dry_run:
+                st["deleted_rows"] += n
+            else:
+                if self.archive:
+                    # archive first; rows are only deleted once they are safely on disk
+                    os.makedirs(os.path.join(self.archive_dir, name), exist_ok=True)
+                    path = _unique(os.path.join(self.archive_dir, name, f"{_day(lo)}.csv.gz"))
+                    tmp = path + ".part.csv.gz"
+                    st["archived_rows"] += export_readings(
+                        tmp, self.db_path, devices=[name], t_from=lo / 1000, t_to=hi / 1000,
+                        columns=ARCHIVE_COLUMNS, max_id=max_id)
+                    os.replace(tmp, path)
+                    st["archive_files"] += 1
+                st["deleted_rows"] += self._delete_chunks(
+                    conn,
+                    "DELETE FROM readings WHERE id IN (SELECT id FROM readings "
+                    "WHERE device_id = ? AND ts_ms >= ? AND ts_ms < ? AND id <= ? LIMIT ?)",
+                    (dev_id, lo, hi, max_id, DELETE_CHUNK))
+            self.log(f"{name} {_day(lo)}: {n} raw rows {'would be ' if self.dry_run else ''}"
+                     f"{'archived and ' if self.archive else ''}deleted")
+            # jump over empty days
+            day = conn.execute("SELECT min(ts_ms) FROM readings WHERE device_id = ? AND ts_ms >= ? AND ts_ms < ?",
+                               (dev_id, hi, cutoff)).fetchone()[0]
+
+    # ---------------- rollups / events ----------------
+    def _prune_rollup(self, conn, table, width, name, cutoff_s):
+        first = conn.execute(f"SELECT min(bucket) FROM {table} WHERE device = ? AND bucket < ?",
+                             (name, cutoff_s)).fetchone()[0]
+        if first is None:
+            return
+        if self.dry_run:
+            self.stats["deleted_rollups"] += conn.execute(
+                f"SELECT count(*) FROM {table} WHERE device = ? AND bucket < ?", (name, cutoff_s)).fetchone()[0]
+            return
+        # WITHOUT ROWID tables: delete in bucket ranges of at most DELETE_CHUNK buckets
+        step = DELETE_CHUNK * width
+        lo = first
+        while lo < cutoff_s and not self.stop_event.is_set():
+            hi = min(lo + step, cutoff_s)
+            with conn:
+                self.stats["deleted_rollups"] += conn.execute(
+                    f"DELETE FROM {table} WHERE device = ? AND bucket >= ? AND bucket < ?",
+                    (name, lo, hi)).rowcount
+            lo = hi
+            self._pause()
+
+    def _prune_events(self, conn, devices, cutoff_ms):
+        for dev_id, _ in devices:
+            if self.dry_run:
+                self.stats["deleted_events"] += conn.execute(
+                    "SELECT (SELECT count(*) FROM alerts WHERE device_id = ?1 AND ts_ms < ?2)"
+                    " + (SELECT count(*) FROM gaps WHERE device_id = ?1 AND end_ms < ?2)",
+                    (dev_id, cutoff_ms)).fetchone()[0]
+                continue
+            self.stats["deleted_events"] += self._delete_chunks(
+                conn,
+                "DELETE FROM alerts WHERE id IN (SELECT id FROM alerts "
+                "WHERE device_id = ? AND ts_ms < ? LIMIT ?)",
+                (dev_id, cutoff_ms, DELETE_CHUNK))
+            with conn:
+                self.stats["deleted_events"] += conn.execute(
+                    "DELETE FROM gaps WHERE device_id = ? AND end_ms < ?", (dev_id, cutoff_ms)).rowcount
+
+    # ---------------- space ----------------
+    def _vacuum(self, conn):
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            # files from before v5: one full VACUUM, here rather than on the thread that opened them
+            self.log("converting to incremental auto-vacuum (one full VACUUM)")
+            enable_incremental_vacuum(conn)
+            self.stats["vacuum_converted"] = 1
+            return
+        while not self.stop_event.is_set():
+            free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if not free:
+                break
+            # executescript steps the pragma to completion; execute() frees a single page
+            conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_PAGES});")
+            self.stats["vacuumed_pages"] += min(free, VACUUM_PAGES)
+            self._pause()
+        # freed pages only leave the file once the WAL is checkpointed
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+
+
+class RetentionWorker:
+    """Runs Retention every INTERVAL_S on a background thread."""
+
+    def __init__(self, db_path=DB_PATH, interval_s=INTERVAL_S, first_run_s=FIRST_RUN_S, **policy):
+        self.db_path = db_path
+        self.interval_s = interval_s
+        self.first_run_s = first_run_s
+        self.policy = policy
+        self.errors = queue.Queue()
+        self.notices = queue.Queue()
+        self.last = None          # stats of the last pass
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        wait = self.first_run_s
+        while not self._stop.wait(wait):
+            wait = self.interval_s
+            try:
+                st = Retention(self.db_path, stop_event=self._stop, **self.policy).run()
+            except Exception as e:
+                self.errors.put(f"Retention error: {e}")
+                continue
+            self.last = st
+            if st["deleted_rows"] or st["deleted_rollups"] or st["deleted_events"] or st["vacuumed_pages"] \
+                    or st["vacuum_converted"]:
+                self.notices.put(summary(st))
+
+
+def summary(st):
+    mb = lambda n: n / 2**20
+    vac = ("converted to incremental auto-vacuum" if st.get("vacuum_converted")
+           else f"{st['vacuumed_pages']} pages vacuumed")
+    return (f"retention: {st['deleted_rows']} raw rows removed ({st['archived_rows']} archived in "
+            f"{st['archive_files']} files), {st['deleted_rollups']} rollup buckets, "
+            f"{st['deleted_events']} alerts/gaps; {vac}, "
+            f"{mb(st['size_before']):.1f} -> {mb(st['size_after']):.1f} MB in {st['seconds']:.1f} s")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Apply the retention policy to the sensor database once.")
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--raw-days", type=int, default=RAW_DAYS, help="keep raw readings this long")
+    ap.add_argument("--event-days", type=int, default=EVENT_DAYS, help="keep alerts and gaps this long")
+    ap.add_argument("--archive-dir", help="default: archive/ next to the database")
+    ap.add_argument("--no-archive", action="store_true", help="delete old raw rows without archiving")
+    ap.add_argument("--dry-run", action="store_true", help="only report what would be removed")
+    args = ap.parse_args(argv)
+
+    conn = open_db(args.db)
+    ensure_schema(conn)
+    conn.close()
+    r = Retention(args.db, raw_days=args.raw_days, event_days=args.event_days,
+                  archive_dir=args.archive_dir, archive=not args.no_archive, dry_run=args.dry_run,
+                  log=lambda msg: print(msg, file=sys.stderr))
+    print(summary(r.run()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
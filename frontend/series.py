@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Time series storage for the plots.
+ - RingBuffer: bounded (timestamp, value) ring with zero-copy ordered views
+ - Decimator: incremental min/max (M4) reduction of a RingBuffer to ~pixel width
+"""
+
+import math
+
+import numpy as np
+
+# ---------------- CONFIG ----------------
+RING_INITIAL = 1024   # ring buffers start this small and double up to their capacity
+# --------------------------------------
+
+
+class RingBuffer:
+    """
+    (timestamp, value) ring of float64 holding at most `capacity` samples.
+    Every sample is written twice (at i and i + allocated size) so the newest
+    `len(self)` samples are always one contiguous slice: view() is ordered,
+    oldest first, and never copies.
+    Storage starts at RING_INITIAL samples and doubles on demand, so idle
+    channels with a large capacity stay cheap.
+    """
+
+    def __init__(self, capacity, initial=RING_INITIAL):
+        self.capacity = int(capacity)
+        self._alloc(min(self.capacity, max(int(initial), 1)))
+        self._head = 0    # next write position, 0 <= head < allocated size
+        self._n = 0
+        self.total = 0    # samples ever appended (lets readers spot new data)
+        self.resets = 0   # bumped by clear()
+
+    def _alloc(self, size):
+        self._size = size
+        self._ts = np.zeros(2 * size, dtype=np.float64)
+        self._val = np.zeros(2 * size, dtype=np.float64)
+
+    def _grow(self, need):
+        size = self._size
+        while size < need and size < self.capacity:
+            size = min(self.capacity, size * 2)
+        if size == self._size:
+            return
+        ts, val = self.view()
+        ts, val = ts.copy(), val.copy()
+        n = len(ts)
+        self._alloc(size)
+        self._ts[:n] = self._ts[size:size + n] = ts
+        self._val[:n] = self._val[size:size + n] = val
+        self._head = n % size
+
+    def __len__(self):
+        return self._n
+
+    def __bool__(self):
+        return self._n > 0
+
+    def append(self, ts, value):
+        if self._n == self._size < self.capacity:
+            self._grow(self._n + 1)
+        i = self._head
+        self._ts[i] = self._ts[i + self._size] = ts
+        self._val[i] = self._val[i + self._size] = value
+        self._head = (i + 1) % self._size
+        if self._n < self._size:
+            self._n += 1
+        self.total += 1
+
+    def extend(self, ts, values):
+        ts = np.asarray(ts, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        self.total += len(ts)
+        if self._n + len(ts) > self._size:
+            self._grow(self._n + len(ts))
+        if len(ts) > self._size:
+            ts, values = ts[-self._size:], values[-self._size:]
+        k = len(ts)
+        if not k:
+            return
+        # positions modulo the allocated size, mirrored into the upper half
+        idx = (self._head + np.arange(k)) % self._size
+        self._ts[idx] = self._ts[idx + self._size] = ts
+        self._val[idx] = self._val[idx + self._size] = values
+        self._head = (self._head + k) % self._size
+        self._n = min(self._n + k, self._size)
+
+    def view(self):
+        """(timestamps, values), oldest first. Read-only views into the buffer."""
+        start = self._head + self._size - self._n
+        ts = self._ts[start:start + self._n]
+        val = self._val[start:start + self._n]
+        ts.flags.writeable = False
+        val.flags.writeable = False
+        return ts, val
+
+    def last(self):
+        if not self._n:
+            return None
+        i = (self._head - 1) % self._size
+        return self._ts[i], self._val[i]
+
+    def clear(self):
+        self._head = 0
+        self._n = 0
+        self.resets += 1
+
+
+def _m4(t, v, bid):
+    # first/min/max/last of every run of equal bucket ids, 4 points per bucket
+    starts = np.flatnonzero(np.r_[True, bid[1:] != bid[:-1]])
+    ends = np.r_[starts[1:], len(bid)] - 1
+    tf, tl = t[starts], t[ends]
+    tm = (tf + tl) * 0.5
+    pts_t = np.column_stack((tf, tm, tm, tl)).ravel()
+    pts_v = np.column_stack((v[starts], np.minimum.reduceat(v, starts),
+                             np.maximum.reduceat(v, starts), v[ends])).ravel()
+    return np.repeat(bid[starts], 4), pts_t, pts_v
+
+
+class Decimator:
+    """
+    Shape-preserving reduction of a RingBuffer for plotting.
+    A window is cut into ~`width` time buckets and each bucket is drawn as
+    its first, min, max and last sample (M4), which is pixel-identical to the
+    raw line at that resolution.
+    Buckets are aligned to absolute time and sized to a power of two seconds,
+    so a finished bucket never changes: they are cached and each call only
+    folds in the samples appended since the previous call.
+    """
+
+    def __init__(self, buf):
+        self.buf = buf
+        self._bucket_s = None
+        self._resets = -1
+        self._done = 0    # buf.total up to which samples sit in finished buckets
+        self._bid = np.empty(0, dtype=np.int64)
+        self._t = np.empty(0)
+        self._v = np.empty(0)
+
+    def _reset(self, bucket_s, n):
+        self._bucket_s = bucket_s
+        self._resets = self.buf.resets
+        self._done = self.buf.total - n
+        self._bid = np.empty(0, dtype=np.int64)
+        self._t = np.empty(0)
+        self._v = np.empty(0)
+
+    def get(self, t0, t1, width):
+        """Points of the buffer within [t0, t1] reduced to about `width` buckets."""
+        ts, vals = self.buf.view()
+        n = len(ts)
+        if t0 is None:
+            t0 = ts[0] if n else t1
+        width = max(int(width), 1)
+        if n <= 4 * width:
+            # already below pixel resolution, plot raw
+            i = np.searchsorted(ts, t0)
+            return ts[i:], vals[i:]
+
+        bucket_s = 2.0 ** math.ceil(math.log2(max((t1 - t0) / width, 1e-3)))
+        new = self.buf.total - self._done
+        if bucket_s != self._bucket_s or self.buf.resets != self._resets or new > n:
+            self._reset(bucket_s, n)
+            new = n
+
+        tail_t, tail_v = ts[n - new:], vals[n - new:]
+        bid = np.floor(tail_t / bucket_s).astype(np.int64)
+        # everything before the newest bucket is finished and can be cached
+        older = np.flatnonzero(bid != bid[-1])
+        k = older[-1] + 1 if len(older) else 0
+        if k:
+            b, t, v = _m4(tail_t[:k], tail_v[:k], bid[:k])
+            self._bid = np.concatenate((self._bid, b))
+            self._t = np.concatenate((self._t, t))
+            self._v = np.concatenate((self._v, v))
+            self._done += k
+
+        # forget buckets the ring has already overwritten
+        first = math.floor(ts[0] / bucket_s)
+        if len(self._bid) and self._bid[0] < first:
+            i = np.searchsorted(self._bid, first)
+            self._bid, self._t, self._v = self._bid[i:], self._t[i:], self._v[i:]
+
+        _, cur_t, cur_v = _m4(tail_t[k:], tail_v[k:], bid[k:])
+        i = np.searchsorted(self._bid, math.floor(t0 / bucket_s))
+        return (np.concatenate((self._t[i:], cur_t)),
+                np.concatenate((self._v[i:], cur_v)))
+
+
+class DeviceSeries:
+    """Plot buffers and latest values for one device."""
+
+    def __init__(self, device, capacity):
+        self.device = device
+        self.temp = RingBuffer(capacity)
+        self.hum = RingBuffer(capacity)
+        self.gas = RingBuffer(capacity)
+        self.decimators = (Decimator(self.temp), Decimator(self.hum), Decimator(self.gas))
+        self.count = 0
+        self.last_ts = None
+        self.temperature = self.humidity = self.gas_value = None
+
+    def add(self, ts, temperature, humidity, gas):
+        self.count += 1
+        self.last_ts = ts
+        if temperature is not None:
+            self.temp.append(ts, temperature)
+            self.temperature = temperature
+        if humidity is not None:
+            self.hum.append(ts, humidity)
+            self.humidity = humidity
+        if gas is not None:
+            self.gas.append(ts, gas)
+            self.gas_value = gas
+
+    def clear(self):
+        self.temp.clear()
+        self.hum.clear()
+        self.gas.clear()
@@ -0,0 +1,517 @@
+#!/usr/bin/env python3
+"""
+SQLite persistence for the air sensor frontend.
+Readings are handed to a background writer thread which groups them into
+executemany() batches and commits once per batch instead of once per message.
+Each batch also updates the 1 min / 1 h / 1 day rollup tables in the same
+transaction, so historical views never have to scan the raw table.
+
+Schema (SCHEMA_VERSION), incremental auto-vacuum (see retention.py):
+    devices(id, name)
+    readings(id, device_id, ts_ms, topic, temperature, humidity, gas, payload)
+        index on (device_id, ts_ms)
+    rollup_1m / rollup_1h / rollup_1d(device, bucket, n, last_ts, per channel n/min/max/sum/last)
+    gaps(device_id, start_ms, end_ms)       holes in a device's series
+    alerts(id, device_id, ts_ms, rule, channel, state, value, reading)
+    schema_version(version)
+ensure_schema() brings older files up to date in place, including v1 (one
+table per device with a local-time TEXT timestamp).
+
+Upgrade / rebuild rollups of an existing database:
+    python storage.py --migrate [sensor_data.db]
+    python storage.py --backfill-rollups [sensor_data.db]
+"""
+
+import sqlite3, threading, queue, time, sys
+
+from perf import perf
+
+# ---------------- CONFIG ----------------
+DB_PATH = "sensor_data.db"
+
+BATCH_ROWS = 500     # flush when this many rows are pending
+FLUSH_MS = 250       # ... or when the oldest pending row is this old
+WRITER_QUEUE_MAX = 20000   # rows waiting for the writer; submit() blocks beyond this
+STORE_PAYLOAD = False  # keep the raw MQTT payload next to the parsed columns
+
+GAP_S = 60           # no reading from a device for this long is recorded as a gap
+
+SCHEMA_VERSION = 5
+
+# (table, bucket width in seconds); buckets are aligned to UTC epoch multiples
+ROLLUP_LEVELS = (
+    ("rollup_1m", 60),
+    ("rollup_1h", 3600),
+    ("rollup_1d", 86400),
+)
+# --------------------------------------
+
+# rollup column prefixes: temperature, humidity, gas
+_CHANNELS = ("t", "h", "g")
+
+_STOP = object()
+_ALERT = object()   # queue tag for alert events, see SQLiteWriter.submit_alert
+
+
+def open_db(path=DB_PATH, readonly=False):
+    if readonly:
+        # readers next to a running recorder (GUI in --read-only mode, exports)
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    # only takes effect on a new, empty file (for free); existing ones see enable_incremental_vacuum()
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    # WAL lets the UI read (export etc.) while the writer thread appends
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+# ---------------- schema ----------------
+READINGS_INSERT_SQL = """
+INSERT INTO readings (device_id, ts_ms, topic, temperature, humidity, gas, payload)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+ALERTS_INSERT_SQL = """
+INSERT INTO alerts (device_id, ts_ms, rule, channel, state, value, reading)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def create_tables(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS devices (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS readings (
+        id INTEGER PRIMARY KEY,
+        device_id INTEGER NOT NULL REFERENCES devices(id),
+        ts_ms INTEGER NOT NULL,
+        topic TEXT NOT NULL,
+        temperature REAL,
+        humidity REAL,
+        gas REAL,
+        payload TEXT
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS readings_device_ts ON readings (device_id, ts_ms)")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS gaps (
+        device_id INTEGER NOT NULL REFERENCES devices(id),
+        start_ms INTEGER NOT NULL,
+        end_ms INTEGER NOT NULL,
+        PRIMARY KEY (device_id, start_ms)
+    ) WITHOUT ROWID
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS alerts (
+        id INTEGER PRIMARY KEY,
+        device_id INTEGER NOT NULL REFERENCES devices(id),
+        ts_ms INTEGER NOT NULL,
+        rule TEXT NOT NULL,
+        channel TEXT NOT NULL,
+        state TEXT NOT NULL,
+        value REAL,
+        reading REAL
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS alerts_device_ts ON alerts (device_id, ts_ms)")
+    conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+    create_rollup_tables(conn)
+
+
+def schema_version(conn):
+    try:
+        row = conn.execute("SELECT max(version) FROM schema_version").fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    if row and row[0]:
+        return row[0]
+    # no version table: either a brand new file or per-device v1 tables
+    return 1 if legacy_tables(conn) else 0
+
+
+def legacy_tables(conn):
+    """v1 per-device tables (device name == table name)."""
+    names = [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")]
+    out = []
+    for name in names:
+        cols = {r[1] for r in conn.execute(f"PRAGMA table_info({name})")}
+        if {"timestamp", "topic", "temperature", "humidity", "gas"} <= cols:
+            out.append(name)
+    return out
+
+
+def device_id(conn, name):
+    conn.execute("INSERT OR IGNORE INTO devices (name) VALUES (?)", (name,))
+    return conn.execute("SELECT id FROM devices WHERE name = ?", (name,)).fetchone()[0]
+
+
+def ensure_schema(conn):
+    """Bring the database to SCHEMA_VERSION. Returns the v1 tables that were migrated."""
+    version = schema_version(conn)
+    if version >= SCHEMA_VERSION:
+        return []
+    legacy = legacy_tables(conn) if version == 1 else []
+    with conn:
+        create_tables(conn)
+        for table in legacy:
+            # v1 stored local time as "%F %T"; 'utc' converts it back to epoch
+            conn.execute(f"""
+            INSERT INTO readings (device_id, ts_ms, topic, temperature, humidity, gas, payload)
+            SELECT ?, CAST(strftime('%s', timestamp, 'utc') AS INTEGER) * 1000,
+                   topic, temperature, humidity, gas, payload
+            FROM {table} ORDER BY id
+            """, (device_id(conn, table),))
+            conn.execute(f"DROP TABLE {table}")
+        conn.execute("DELETE FROM schema_version")
+        conn.execute("INSERT INTO schema_version (version) VALUES (?)", (SCHEMA_VERSION,))
+    if legacy:
+        backfill_rollups(conn, legacy)
+    return legacy
+
+
+def enable_incremental_vacuum(conn):
+    """
+    Let retention hand freed pages back in small steps. Existing files need one
+    full VACUUM to convert, so this runs in the retention worker or --migrate,
+    never where a caller waits for it (ensure_schema runs on the UI thread).
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return False
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    # the mode only takes effect once the file has been rebuilt
+    conn.execute("VACUUM")
+    return True
+
+
+# ---------------- rollups ----------------
+def create_rollup_tables(conn):
+    chan_cols = ", ".join(
+        f"{c}_n INTEGER NOT NULL DEFAULT 0, {c}_min REAL, {c}_max REAL, "
+        f"{c}_sum REAL NOT NULL DEFAULT 0, {c}_last REAL"
+        for c in _CHANNELS
+    )
+    for name, _ in ROLLUP_LEVELS:
+        # mean of a channel = {c}_sum / {c}_n; device is the device name
+        conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {name} (
+            device TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            n INTEGER NOT NULL,
+            last_ts REAL NOT NULL,
+            {chan_cols},
+            PRIMARY KEY (device, bucket)
+        ) WITHOUT ROWID
+        """)
+
+
+def _rollup_upsert_sql(name):
+    cols = ["device", "bucket", "n", "last_ts"]
+    sets = ["n = n + excluded.n"]
+    for c in _CHANNELS:
+        cols += [f"{c}_n", f"{c}_min", f"{c}_max", f"{c}_sum", f"{c}_last"]
+        # min()/max() with a NULL argument return NULL in SQLite, hence the coalesces
+        sets += [
+            f"{c}_n = {c}_n + excluded.{c}_n",
+            f"{c}_min = min(coalesce({c}_min, excluded.{c}_min), coalesce(excluded.{c}_min, {c}_min))",
+            f"{c}_max = max(coalesce({c}_max, excluded.{c}_max), coalesce(excluded.{c}_max, {c}_max))",
+            f"{c}_sum = {c}_sum + excluded.{c}_sum",
+            f"{c}_last = CASE WHEN excluded.last_ts >= last_ts "
+            f"THEN coalesce(excluded.{c}_last, {c}_last) ELSE coalesce({c}_last, excluded.{c}_last) END",
+        ]
+    # every SET expression sees the old row, so last_ts can be updated alongside
+    sets.append("last_ts = max(last_ts, excluded.last_ts)")
+    return (f"INSERT INTO {name} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) "
+            f"ON CONFLICT(device, bucket) DO UPDATE SET {', '.join(sets)}")
+
+
+class RollupBatch:
+    """Per-bucket aggregates of a batch of readings, merged into the rollup tables by flush()."""
+
+    def __init__(self):
+        self.acc = [{} for _ in ROLLUP_LEVELS]   # per level: (device, bucket) -> aggregate list
+
+    def add(self, device, ts, values):
+        for acc, (_, width) in zip(self.acc, ROLLUP_LEVELS):
+            key = (device, int(ts // width) * width)
+            a = acc.get(key)
+            if a is None:
+                # n, last_ts, then n/min/max/sum/last for each channel
+                a = acc[key] = [0, ts] + [0, None, None, 0.0, None] * len(_CHANNELS)
+            newer = ts >= a[1]
+            a[0] += 1
+            if newer:
+                a[1] = ts
+            for i, v in enumerate(values):
+                if v is None:
+                    continue
+                j = 2 + 5 * i
+                a[j] += 1
+                a[j + 1] = v if a[j + 1] is None else min(a[j + 1], v)
+                a[j + 2] = v if a[j + 2] is None else max(a[j + 2], v)
+                a[j + 3] += v
+                if newer or a[j + 4] is None:
+                    a[j + 4] = v
+
+    def __len__(self):
+        return sum(len(acc) for acc in self.acc)
+
+    def flush(self, conn, since=None):
+        # caller owns the transaction; since = per level, buckets before it are discarded
+        for i, (acc, (name, _)) in enumerate(zip(self.acc, ROLLUP_LEVELS)):
+            if since is not None:
+                for key in [k for k in acc if k[1] < since[i]]:
+                    del acc[key]
+            if acc:
+                conn.executemany(_rollup_upsert_sql(name),
+                                 [(dev, bucket, *a) for (dev, bucket), a in acc.items()])
+                acc.clear()
+
+
+def backfill_rollups(conn, devices=None, chunk=5000):
+    """
+    Recompute the rollups of the given devices (default: all of them) from the raw
+    readings. Where retention has already deleted older raw rows, only the buckets
+    that start at or after the oldest remaining reading are rebuilt; the older
+    ones are the only copy of that history and are kept.
+    """
+    ids = dict(conn.execute("SELECT name, id FROM devices"))
+    widest, width_max = ROLLUP_LEVELS[-1]
+    for device in devices or list(ids):
+        if device not in ids:
+            continue
+        first_ms = conn.execute("SELECT min(ts_ms) FROM readings WHERE device_id = ?",
+                                (ids[device],)).fetchone()[0]
+        if first_ms is None:
+            continue
+        oldest = conn.execute(f"SELECT min(bucket) FROM {widest} WHERE device = ?",
+                              (device,)).fetchone()[0]
+        if oldest is not None and oldest < first_ms // 1000 // width_max * width_max:
+            # rollups reach back further than the raw rows: pruned, rebuild whole buckets only
+            since = [-(-first_ms // (width * 1000)) * width for _, width in ROLLUP_LEVELS]
+        else:
+            since = [0] * len(ROLLUP_LEVELS)
+        with conn:
+            for (name, _), lo in zip(ROLLUP_LEVELS, since):
+                conn.execute(f"DELETE FROM {name} WHERE device = ? AND bucket >= ?", (device, lo))
+            cur = conn.execute(
+                "SELECT ts_ms, temperature, humidity, gas FROM readings "
+                "WHERE device_id = ? AND ts_ms >= ? ORDER BY ts_ms", (ids[device], min(since) * 1000))
+            batch = RollupBatch()
+            while True:
+                rows = cur.fetchmany(chunk)
+                if not rows:
+                    break
+                for ts_ms, t, h, g in rows:
+                    batch.add(device, ts_ms / 1000.0, (t, h, g))
+                batch.flush(conn, since)
+
+
+class SQLiteWriter:
+    """
+    Background thread that drains (device, ts, row) items into batched inserts,
+    row = (topic, temperature, humidity, gas, payload). Expects ensure_schema()
+    to have been run on the database.
+    Also records a gap whenever a device was silent for more than gap_s,
+    including across restarts (the last timestamp per device is read at start).
+    The queue is bounded: when the disk can't keep up, submit() blocks the
+    ingest thread, so the ingest queue fills and its drop policy applies.
+    """
+
+    def __init__(self, path, batch_rows=BATCH_ROWS, flush_ms=FLUSH_MS, store_payload=STORE_PAYLOAD,
+                 gap_s=GAP_S, maxsize=WRITER_QUEUE_MAX):
+        self.path = path
+        self.store_payload = store_payload
+        self.gap_s = gap_s
+        self.batch_rows = batch_rows
+        self.flush_s = flush_ms / 1000.0
+
+        self.q = queue.Queue(maxsize=maxsize)
+        self.errors = queue.Queue()  # drained by the owner (UI thread)
+        self.notices = queue.Queue()  # informational, e.g. detected gaps
+        self._thread = None
+
+        # stats (written by the writer thread only)
+        self.rows_written = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.gaps_found = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, device, ts, row):
+        self.q.put((device, ts, row))
+
+    def submit_alert(self, alert):
+        """alert = alerts.Alert (ts, device, rule, channel, state, value, reading)."""
+        self.q.put((_ALERT, alert))
+
+    def stop(self, timeout=5.0):
+        if self._thread is None:
+            return
+        try:
+            self.q.put(_STOP, timeout=timeout)
+        except queue.Full:
+            # writer thread stuck or gone; don't hang the caller's shutdown
+            self.errors.put("Writer did not drain its queue; pending rows were not stored")
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self):
+        """Counters since start; callers derive rates from two reads of "rows"."""
+        return {
+            "rows": self.rows_written,
+            "flushes": self.flushes,
+            "last_flush_ms": self.last_flush_ms,
+            "max_flush_ms": self.max_flush_ms,
+            "pending": self.q.qsize(),
+            "gaps": self.gaps_found,
+        }
+
+    # ---------------- writer thread ----------------
+    def _run(self):
+        conn = open_db(self.path)
+        self._device_ids = dict(conn.execute("SELECT name, id FROM devices"))
+        # newest stored timestamp per device, for gap detection
+        self._last_ts = {}
+        for name, dev_id in self._device_ids.items():
+            ms = conn.execute("SELECT max(ts_ms) FROM readings WHERE device_id = ?", (dev_id,)).fetchone()[0]
+            if ms is not None:
+                self._last_ts[name] = ms / 1000.0
+        batch = []
+        alerts = []
+        deadline = 0.0
+        stopping = False
+        while not stopping:
+            timeout = max(0.0, deadline - time.monotonic()) if batch or alerts else None
+            try:
+                item = self.q.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            # grab whatever else is already waiting, up to one batch
+            while item is not None:
+                if item is _STOP:
+                    stopping = True
+                    break
+                if not batch and not alerts:
+                    deadline = time.monotonic() + self.flush_s
+                if item[0] is _ALERT:
+                    alerts.append(item[1])
+                else:
+                    batch.append(item)
+                if len(batch) >= self.batch_rows:
+                    break
+                try:
+                    item = self.q.get_nowait()
+                except queue.Empty:
+                    item = None
+
+            if (batch or alerts) and (stopping or len(batch) >= self.batch_rows
+                                      or time.monotonic() >= deadline):
+                self._flush(conn, batch, alerts)
+                batch = []
+                alerts = []
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _flush(self, conn, batch, alerts=()):
+        t0 = time.perf_counter()
+        try:
+            try:
+                new_ids, last, gaps, t_commit = self._write(conn, batch, alerts, t0)
+            except sqlite3.OperationalError:
+                # locked / busy past the connection's timeout (a long reader, a VACUUM):
+                # the transaction was rolled back, so the same batch can go again
+                new_ids, last, gaps, t_commit = self._write(conn, batch, alerts, t0)
+        except Exception as e:
+            self.errors.put(f"DB write error ({len(batch)} rows, {len(alerts)} alerts dropped): {e}")
+            return
+        if t_commit is not None:
+            perf.observe("db.commit", time.perf_counter() - t_commit)
+        # only committed state is cached: a rolled back device row must be inserted again
+        self._device_ids.update(new_ids)
+        self._last_ts = last
+        if gaps:
+            names = {v: k for k, v in self._device_ids.items()}
+            for dev_id, start_ms, end_ms in gaps:
+                self.notices.put(f"gap in {names[dev_id]}: no data for {(end_ms - start_ms) / 1000:.0f} s "
+                                 f"since {time.strftime('%F %T', time.localtime(start_ms / 1000))}")
+            self.gaps_found += len(gaps)
+        ms = (time.perf_counter() - t0) * 1000.0
+        self.rows_written += len(batch)
+        self.flushes += 1
+        self.last_flush_ms = ms
+        self.max_flush_ms = max(self.max_flush_ms, ms)
+
+    def _write(self, conn, batch, alerts, t0):
+        """One transaction for the batch; returns (new device ids, last ts, gaps, commit start)."""
+        ids = self._device_ids
+        new_ids = {}
+        last = dict(self._last_ts)
+        rollups = RollupBatch()
+        gaps = []
+        t_commit = None
+
+        def dev_id_of(device):
+            dev_id = ids.get(device) or new_ids.get(device)
+            if dev_id is None:
+                dev_id = new_ids[device] = device_id(conn, device)
+            return dev_id
+
+        with conn:
+            rows = []
+            for device, ts, (topic, t, h, g, payload) in batch:
+                dev_id = dev_id_of(device)
+                ts_ms = int(round(ts * 1000))
+                rows.append((dev_id, ts_ms, topic, t, h, g,
+                             payload if self.store_payload else None))
+                rollups.add(device, ts, (t, h, g))
+                prev = last.get(device)
+                if prev is not None and ts - prev > self.gap_s:
+                    gaps.append((dev_id, int(round(prev * 1000)), ts_ms))
+                if prev is None or ts > prev:
+                    last[device] = ts
+            conn.executemany(READINGS_INSERT_SQL, rows)
+            rollups.flush(conn)
+            if gaps:
+                conn.executemany("INSERT OR REPLACE INTO gaps (device_id, start_ms, end_ms) "
+                                 "VALUES (?, ?, ?)", gaps)
+            if alerts:
+                conn.executemany(ALERTS_INSERT_SQL, [
+                    (dev_id_of(a.device), int(round(a.ts * 1000)), a.rule, a.channel,
+                     a.state, a.value, a.reading) for a in alerts])
+            if perf.enabled:
+                t_commit = time.perf_counter()
+                perf.observe("db.insert", t_commit - t0)
+        return new_ids, last, gaps, t_commit
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("--migrate", "--backfill-rollups"):
+        print(__doc__)
+        sys.exit(2)
+    path = sys.argv[2] if len(sys.argv) > 2 else DB_PATH
+    conn = open_db(path)
+    t0 = time.time()
+    migrated = ensure_schema(conn)
+    if migrated:
+        print(f"migrated to schema v{SCHEMA_VERSION}: {', '.join(migrated)}")
+    if enable_incremental_vacuum(conn):
+        print("converted to incremental auto-vacuum")
+    if sys.argv[1] == "--backfill-rollups":
+        backfill_rollups(conn)
+    for name, _ in ROLLUP_LEVELS:
+        n = conn.execute(f"SELECT count(*) FROM {name}").fetchone()[0]
+        print(f"{name}: {n} buckets")
+    print(f"done in {time.time() - t0:.1f} s")
+    conn.close()